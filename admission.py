@@ -0,0 +1,181 @@
+"""Admission control and idle-session eviction for classroom bursts.
+
+Every full script run passes through `admit_session()` before the app
+touches its state. A session holds a seat from its first admitted run until
+it goes idle or its tab closes. Past BUBBLES_MAX_SESSIONS seats, new sessions
+get a small waiting screen that polls for a seat, first come first served.
+So when a whole class opens the app at once, the sessions start a few at a
+time instead of all rendering their first screen together.
+
+A session is idle once neither a full run nor a saved snapshot (see
+session_store.py) has happened for BUBBLES_IDLE_TTL seconds. By then its game
+is already in the snapshot store, so a background thread simply clears the
+snapshotted fields from its st.session_state and frees its seat. If the tab
+comes back it queues for a seat like a new session (a fragment rerun is
+turned into a full run for that, see session_store.persisted), and
+restore_session() picks the game up again. The same thread frees the seats
+of closed tabs, whether or not idle sessions are cleared.
+
+    BUBBLES_MAX_SESSIONS   seats per app process (default: 0, no limit)
+    BUBBLES_IDLE_TTL       seconds before an idle session is cleared (default: 1800, 0 never)
+
+Active, idle and queued sessions are reported as the bubbles_sessions gauge
+on the metrics endpoint (see instrumentation.py).
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import streamlit as st
+from streamlit.runtime import Runtime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from instrumentation import register_gauge
+from session_store import FIELDS
+
+MAX_SESSIONS = int(os.environ.get("BUBBLES_MAX_SESSIONS") or 0)
+IDLE_TTL = float(os.environ.get("BUBBLES_IDLE_TTL") or 1800)
+# Seconds between a waiting session's checks for a seat
+POLL_INTERVAL = 2
+# A waiting session that stopped checking for this long has left the queue
+WAIT_TIMEOUT = 3 * POLL_INTERVAL
+# Seconds between sweeps for idle and closed sessions
+SWEEP_INTERVAL = 30
+
+
+class SessionGate:
+    """Seats for this process's sessions, a queue for the rest, and the idle sweeper"""
+
+    def __init__(self, max_sessions=MAX_SESSIONS, idle_ttl=IDLE_TTL, sweep_interval=SWEEP_INTERVAL):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        # session id -> [session state, last full run]; the state is only kept
+        # when idle sessions are cleared, so nothing else holds on to it
+        self._seated = {}
+        # session id -> last check for a seat, in arrival order
+        self._waiting = OrderedDict()
+        # Sessions cleared for idling whose tab is still open
+        self._idle = set()
+        self._lock = threading.Lock()
+        threading.Thread(target=self._run, args=(sweep_interval,), name="bubbles-sessions", daemon=True).start()
+
+    def admit(self, session_id, state):
+        """Whether the session may run; otherwise it keeps its place in the queue"""
+        now = time.monotonic()
+        with self._lock:
+            if session_id in self._seated:
+                self._seated[session_id][1] = now
+                return True
+            self._idle.discard(session_id)
+            for waiter, last_check in list(self._waiting.items()):
+                if now - last_check > WAIT_TIMEOUT:
+                    del self._waiting[waiter]
+            self._waiting[session_id] = now
+            if self.max_sessions and len(self._seated) >= self.max_sessions:
+                self._release_closed()
+            # Seats go to the longest waiting sessions first
+            if not self.max_sessions or list(self._waiting).index(session_id) < self.max_sessions - len(self._seated):
+                del self._waiting[session_id]
+                self._seated[session_id] = [state if self.idle_ttl else None, now]
+                return True
+            return False
+
+    def position(self, session_id):
+        """1-based place in the queue, or None if the session isn't waiting"""
+        with self._lock:
+            if session_id not in self._waiting:
+                return None
+            return list(self._waiting).index(session_id) + 1
+
+    def _release_closed(self):
+        """Free the seats of sessions whose tab has closed; call with the lock held"""
+        if not Runtime.exists():
+            return
+        for session_id in list(self._seated):
+            if not Runtime.instance().is_active_session(session_id):
+                del self._seated[session_id]
+        self._idle = {session_id for session_id in self._idle if Runtime.instance().is_active_session(session_id)}
+
+    def sweep(self):
+        """Free the seats of closed sessions and clear idle ones; returns sessions cleared"""
+        now = time.monotonic()
+        wall = time.time()
+        cleared = []
+        with self._lock:
+            self._release_closed()
+            if not self.idle_ttl:
+                return 0
+            for session_id, (state, last_run) in list(self._seated.items()):
+                sync = state["state_sync"] if "state_sync" in state else {}
+                idle = min(now - last_run, wall - sync.get("saved_at", 0))
+                # Only sessions with a snapshot to come back to are cleared
+                if idle > self.idle_ttl and sync.get("version"):
+                    del self._seated[session_id]
+                    self._idle.add(session_id)
+                    cleared.append(state)
+        for state in cleared:
+            # Only what the snapshot brings back; per-render flags stay as they are
+            for key in (*FIELDS, "state_sync"):
+                try:
+                    del state[key]
+                except KeyError:
+                    pass
+        return len(cleared)
+
+    def reset(self):
+        """Forget every seat and queued session, e.g. the launcher's warm-up renders"""
+        with self._lock:
+            self._seated.clear()
+            self._waiting.clear()
+            self._idle.clear()
+
+    def _run(self, sweep_interval):
+        while True:
+            time.sleep(sweep_interval)
+            self.sweep()
+
+    def counts(self):
+        """{"active", "idle", "queued"} session counts"""
+        now = time.monotonic()
+        with self._lock:
+            queued = sum(1 for last_check in self._waiting.values() if now - last_check <= WAIT_TIMEOUT)
+            return {"active": len(self._seated), "idle": len(self._idle), "queued": queued}
+
+
+@st.cache_resource
+def session_gate():
+    """The gate shared by every session in this process"""
+    gate = SessionGate()
+    register_gauge("bubbles_sessions", "Sessions by state.", lambda: [({"state": name}, n) for name, n in gate.counts().items()])
+    return gate
+
+
+def waiting_screen(gate, session_id):
+    """Shown instead of the app while the session waits for a seat"""
+    st.markdown('<h1 class="main-header">Kids Learning Adventure</h1>', unsafe_allow_html=True)
+
+    @st.fragment(run_every=POLL_INTERVAL)
+    def waiting_room():
+        if gate.admit(session_id, get_script_run_ctx().session_state):
+            st.rerun()
+        st.markdown(f"""
+        <div class="mascot">🐻</div>
+        <div class="message-bubble">
+            <p>Lots of friends are playing right now! You're number {gate.position(session_id)} in line.</p>
+        </div>
+        """, unsafe_allow_html=True)
+
+    waiting_room()
+
+
+def admit_session():
+    """Let this run through, or show the waiting screen and stop it"""
+    ctx = get_script_run_ctx()
+    # Teachers and other ?view= pages never wait
+    if ctx is None or st.query_params.get("view"):
+        return
+    gate = session_gate()
+    if not gate.admit(ctx.session_id, ctx.session_state):
+        waiting_screen(gate, ctx.session_id)
+        st.stop()
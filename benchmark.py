@@ -0,0 +1,497 @@
+"""Headless rerun benchmark for bubble.py.
+
+Drives main() through Streamlit's AppTest harness and reports, for every
+rerun of every screen, the wall time, the number of elements emitted, the
+bytes of HTML produced and the bytes of session state the session holds.
+
+    python benchmark.py                 # print a report
+    python benchmark.py --save          # write benchmark_baseline.json
+    python benchmark.py --compare       # fail if a rerun got more expensive
+    python benchmark.py --gallery 10000 # storage and load times for a gallery
+    python benchmark.py --school 30     # teacher dashboard for 30 classes
+    python benchmark.py --traces traces # replay recorded click traces (traces.py)
+"""
+import argparse
+import glob
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+
+from streamlit import logger as st_logger
+from streamlit.components.v2.bidi_component.main import _make_trigger_id
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+from streamlit.testing.v1 import AppTest
+
+import certificates
+import events
+import gallery
+import instrumentation
+import progress
+import theme
+import traces
+from drawing_canvas import BRUSH_SIZES, HEIGHT, PALETTE, WIDTH
+from rounds import ROUND_TRANSITION_DELAY
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bubble.py")
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+TRACES_BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "traces_baseline.json")
+
+# [correct, target, response ms] as the in-browser board reports answers
+BROWSER_ANSWERS = [[1, 3, 1800], [0, 5, 2400], [1, 5, 900], [1, 2, 1500], [1, 4, 1100], [1, 6, 1300]]
+
+# Each scenario starts from a fresh session and is a list of (step, action)
+# pairs. An action is a button key to click, a (component key, event, value)
+# trigger sent by a custom component, or None for a plain rerun.
+SCENARIOS = {
+    "menu": [
+        ("load", None),
+    ],
+    "counting": [
+        ("open", "menu_counting"),
+        ("answer", "counting_option_0"),
+        ("answer_again", "counting_option_1"),
+        ("back", "counting_back"),
+    ],
+    "alphabet": [
+        ("open", "menu_alphabet"),
+        ("show_word", "alphabet_word"),
+        ("next", "alphabet_next"),
+        ("back", "alphabet_back"),
+    ],
+    "drawing": [
+        ("open", "menu_drawing"),
+        ("back", "drawing_back"),
+    ],
+    "shapes": [
+        ("open", "menu_shapes"),
+        ("click", ("shape_board", "clicked", 0)),
+        ("back", "shapes_back"),
+    ],
+    "reward": [
+        ("open", "view_certificate"),
+        ("back", "reward_back"),
+    ],
+    # Counting played in the browser (?engine=client): one sync of 5 points
+    # from 6 answers, then Back resending them as if the first sync's render
+    # never arrived
+    "browser": [
+        ("open", "menu_counting"),
+        ("sync", ("counting_browser", "sync", {"mount": "bench", "points": 5, "finished": [], "answers_base": 0, "answers": BROWSER_ANSWERS})),
+        ("back", ("counting_browser", "sync", {"mount": "bench", "points": 5, "finished": [], "answers_base": 0, "answers": BROWSER_ANSWERS, "back": True})),
+    ],
+}
+
+METRICS = ("wall_ms", "elements", "html_bytes", "state_bytes")
+
+
+def _walk(node):
+    """Yield every element and layout block below an AppTest tree node"""
+    for child in getattr(node, "children", {}).values():
+        yield child
+        yield from _walk(child)
+
+
+# Element fields that carry markup, or data a custom component turns into markup
+HTML_FIELDS = ("body", "srcdoc", "label", "html_content", "css_content", "js_content", "json")
+
+
+def _html_size(element):
+    """Bytes of HTML an element ships to the browser"""
+    proto = getattr(element, "proto", None)
+    total = 0
+    for field in HTML_FIELDS:
+        value = getattr(proto, field, None)
+        if isinstance(value, str):
+            total += len(value.encode("utf-8"))
+    return total
+
+
+def measure_tree(at):
+    """Count the elements and HTML bytes of the last rerun"""
+    elements = 0
+    html_bytes = 0
+    for element in _walk(at.main):
+        elements += 1
+        html_bytes += _html_size(element)
+    return elements, html_bytes
+
+
+def _prepare(at, scenario):
+    """Put a fresh session into the state a scenario needs"""
+    if scenario == "reward":
+        # The certificate button only shows up once the child has 10 points
+        progress.progress_store().record(at.query_params["child"], "counting", 10)
+        # Render the PDF up front, so every run measures the screen with its
+        # download button rather than racing the worker processes
+        name = at.query_params["child"].title()
+        os.makedirs(certificates.CERTIFICATES_DIR, exist_ok=True)
+        path = os.path.join(certificates.CERTIFICATES_DIR, f"{certificates.certificate_key(name, 10)}.pdf")
+        certificates._render_to_file(path, name, 10, certificates.DEFAULT_TEMPLATE)
+        at.run()
+    elif scenario == "browser":
+        at.query_params["engine"] = "client"
+        at.run()
+
+
+def _trigger(at, key, event, value):
+    """Rerun as if custom component `key` had fired `event` with `value`"""
+    for element in _walk(at.main):
+        if getattr(element, "type", None) == "bidi_component" and element.key == key:
+            break
+    else:
+        raise KeyError(key)
+    # AppTest has no driver for custom components, so send the trigger the
+    # browser would have sent alongside the regular widget states
+    widget_states = at._tree.get_widget_states()
+    trigger = WidgetState(id=_make_trigger_id(element.proto.id, "events"))
+    trigger.json_trigger_value = json.dumps([{"event": event, "value": value}])
+    widget_states.widgets.append(trigger)
+    at._run(widget_states)
+
+
+def _new_session(query=None):
+    """A fresh AppTest session for a child of its own, so saved progress doesn't leak in"""
+    at = AppTest.from_file(APP_PATH, default_timeout=30)
+    at.query_params["child"] = f"bench-{uuid.uuid4().hex[:8]}"
+    at.query_params.update(query or {})
+    return at
+
+
+def _measure_step(at, name, action):
+    """Take one action and measure the rerun it causes"""
+    if isinstance(action, str):
+        at.button(key=action).click()
+    start = time.perf_counter()
+    if isinstance(action, tuple):
+        _trigger(at, *action)
+    else:
+        at.run()
+    wall_ms = (time.perf_counter() - start) * 1000
+    if at.exception:
+        raise RuntimeError(f"{name} raised: {at.exception[0].message}")
+    elements, html_bytes = measure_tree(at)
+    return {
+        "wall_ms": wall_ms,
+        "elements": elements,
+        "html_bytes": html_bytes,
+        "state_bytes": instrumentation.session_state_bytes(at.session_state),
+    }
+
+
+def run_scenario(scenario, seed=0):
+    """Run one scenario once and return per-step measurements"""
+    random.seed(seed)
+    at = _new_session()
+    at.run()
+    # Session state is poked from this thread; keep the context warnings out of the report
+    st_logger.set_log_level("error")
+    _prepare(at, scenario)
+
+    results = {}
+    for step, action in SCENARIOS[scenario]:
+        name = f"{scenario}/{step}"
+        results[name] = _measure_step(at, name, action)
+    return results
+
+
+def _end_round_transitions(at):
+    """Run the rerun a browser's timer would have sent once a round's celebration is over"""
+    for game in ROUND_TRANSITION_DELAY:
+        key = f"{game}_next_round_at"
+        if key in at.session_state and at.session_state[key] is not None:
+            at.session_state[key] = 0
+            at.run()
+
+
+def run_trace(trace):
+    """Replay one recorded trace; returns ([(name, measurements)], steps skipped)"""
+    query = dict(trace["query"])
+    if trace["seed"] is not None:
+        query["seed"] = str(trace["seed"])
+    at = _new_session(query)
+    st_logger.set_log_level("error")
+
+    results = []
+    skipped = 0
+    for screen, action, _, _ in trace["steps"]:
+        _end_round_transitions(at)
+        name = f"{screen}/{traces.action_label(action)}"
+        if isinstance(action, list):
+            key, event, value = action
+            action = (key, event, traces.replay_value(key, event, value))
+        try:
+            results.append((name, _measure_step(at, name, action)))
+        except KeyError:
+            # The replay went somewhere the recording didn't; skip the click
+            skipped += 1
+    return results, skipped
+
+
+def run_traces(directory, repeat=1):
+    """Replay every trace in `directory`; returns (report, traces, steps skipped)
+
+    Steps are reported per screen and action, with median costs: unlike the
+    scenarios, a trace's mix of clicks is the point, not the fastest one.
+    """
+    paths = sorted(glob.glob(os.path.join(directory, "*.jsonl")))
+    samples = {}
+    skipped = 0
+    for _ in range(repeat):
+        for path in paths:
+            results, missed = run_trace(traces.load_trace(path))
+            skipped += missed
+            for name, metrics in results:
+                samples.setdefault(name, []).append(metrics)
+
+    report = {}
+    for name in sorted(samples):
+        runs = samples[name]
+        report[name] = {
+            "wall_ms": round(statistics.median(run["wall_ms"] for run in runs), 3),
+            "elements": statistics.median(run["elements"] for run in runs),
+            "html_bytes": statistics.median(run["html_bytes"] for run in runs),
+            "state_bytes": statistics.median(run["state_bytes"] for run in runs),
+            "count": len(runs),
+        }
+    return report, len(paths), skipped
+
+
+def run_benchmark(scenarios=None, repeat=5):
+    """Run every scenario `repeat` times and keep the best time and median sizes"""
+    samples = {}
+    for scenario in scenarios or SCENARIOS:
+        for i in range(repeat):
+            for name, metrics in run_scenario(scenario, seed=i).items():
+                samples.setdefault(name, []).append(metrics)
+
+    report = {}
+    for name, runs in samples.items():
+        # The fastest run is the least noisy estimate of a rerun's cost
+        report[name] = {
+            "wall_ms": round(min(run["wall_ms"] for run in runs), 3),
+            "elements": statistics.median(run["elements"] for run in runs),
+            "html_bytes": statistics.median(run["html_bytes"] for run in runs),
+            "state_bytes": statistics.median(run["state_bytes"] for run in runs),
+        }
+    return report
+
+
+def compare(report, baseline, threshold, time_threshold):
+    """Return the list of reruns whose cost grew past the thresholds"""
+    regressions = []
+    for name, metrics in report.items():
+        if name not in baseline:
+            continue
+        for metric in METRICS:
+            old = baseline[name].get(metric)
+            new = metrics[metric]
+            limit = time_threshold if metric == "wall_ms" else threshold
+            if old and (new - old) / old > limit:
+                regressions.append(f"{name} {metric}: {old} -> {new} (+{(new - old) / old:.0%})")
+    return regressions
+
+
+def print_report(report, baseline=None):
+    """Print a table of the report, with deltas if a baseline is given"""
+    width = max([26] + [len(name) + 2 for name in report])
+    print(f"{'rerun':<{width}}{'wall ms':>10}{'elements':>10}{'html bytes':>12}{'state bytes':>13}")
+    for name, metrics in report.items():
+        line = f"{name:<{width}}{metrics['wall_ms']:>10.1f}{metrics['elements']:>10}{metrics['html_bytes']:>12}{metrics['state_bytes']:>13}"
+        if baseline and name in baseline:
+            old = baseline[name]
+            line += f"   (base {old['wall_ms']:.1f} / {old['elements']} / {old['html_bytes']} / {old.get('state_bytes', '-')})"
+        print(line)
+
+
+def load_baseline(path=BASELINE_PATH):
+    """Load the checked-in baseline report"""
+    with open(path) as f:
+        return json.load(f)["reruns"]
+
+
+def save_baseline(report, path=BASELINE_PATH):
+    """Write a report as the new baseline"""
+    with open(path, "w") as f:
+        json.dump({"python": sys.version.split()[0], "reruns": report}, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def _random_drawing(rng):
+    """A drawing shaped like real canvas output: a few wandering strokes"""
+    strokes = []
+    for _ in range(rng.randint(3, 15)):
+        points = [rng.randrange(WIDTH), rng.randrange(HEIGHT)]
+        for _ in range(rng.randint(10, 80)):
+            points.extend((rng.randint(-6, 6), rng.randint(-6, 6)))
+        strokes.append({"c": rng.randrange(len(PALETTE)), "s": rng.choice(BRUSH_SIZES), "p": points})
+    return strokes
+
+
+def run_gallery_benchmark(count, seed=0):
+    """Save `count` drawings to a scratch gallery and time the gallery paths"""
+    rng = random.Random(seed)
+    root = tempfile.mkdtemp(prefix="bubbles-gallery-")
+    try:
+        json_bytes = 0
+        start = time.perf_counter()
+        for _ in range(count):
+            strokes = _random_drawing(rng)
+            json_bytes += len(json.dumps(strokes, separators=(",", ":")))
+            gallery.save_drawing("bench", strokes, root=root)
+        save_s = time.perf_counter() - start
+
+        disk_bytes = gallery.stored_bytes("bench", root=root)
+
+        start = time.perf_counter()
+        entries = gallery.list_drawings("bench", root=root)
+        list_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        strokes = gallery.load_drawing("bench", entries[0]["id"], root=root)
+        load_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        gallery.rasterize_thumbnail(strokes)
+        thumb_ms = (time.perf_counter() - start) * 1000
+    finally:
+        shutil.rmtree(root)
+
+    return {
+        "drawings": count,
+        "json_bytes": json_bytes,
+        "disk_bytes": disk_bytes,
+        "save_ms_per_drawing": save_s * 1000 / count,
+        "open_gallery_ms": list_ms,
+        "load_drawing_ms": load_ms,
+        "thumbnail_ms": thumb_ms,
+    }
+
+
+def print_gallery_report(result):
+    print(f"{'drawings':<22}{result['drawings']:>12}")
+    print(f"{'strokes as JSON':<22}{result['json_bytes']:>12} bytes")
+    print(f"{'on disk':<22}{result['disk_bytes']:>12} bytes ({result['disk_bytes'] / result['json_bytes']:.0%} of JSON)")
+    print(f"{'save':<22}{result['save_ms_per_drawing']:>12.3f} ms/drawing")
+    print(f"{'open gallery':<22}{result['open_gallery_ms']:>12.1f} ms")
+    print(f"{'load one drawing':<22}{result['load_drawing_ms']:>12.3f} ms")
+    print(f"{'render one thumbnail':<22}{result['thumbnail_ms']:>12.1f} ms")
+
+
+def run_school_benchmark(classes, class_size=25, repeat=5, seed=0):
+    """Fill the progress store with a school's classes and time the teacher dashboard"""
+    rng = random.Random(seed)
+    store = progress.progress_store()
+    totals = {}
+    for c in range(classes):
+        for k in range(class_size):
+            child = f"school-{c}-{k}"
+            store.join_class(child, f"Class {c + 1}")
+            for game in ("counting", "alphabet", "shapes"):
+                answers = rng.randint(50, 500)
+                store.record(child, game, rng.randint(0, answers))
+                totals[(child, game)] = (answers, rng.randint(answers // 2, answers), answers * rng.randint(800, 4000))
+    store.add_answers(totals)
+    store.flush()
+
+    times = []
+    for _ in range(repeat):
+        at = AppTest.from_file(APP_PATH, default_timeout=30)
+        at.query_params["view"] = "teacher"
+        start = time.perf_counter()
+        at.run()
+        times.append((time.perf_counter() - start) * 1000)
+        if at.exception:
+            raise RuntimeError(f"dashboard raised: {at.exception[0].message}")
+    return {
+        "classes": classes,
+        "children": classes * class_size,
+        "first_ms": times[0],
+        "best_ms": min(times),
+        "elements": measure_tree(at)[0],
+    }
+
+
+def print_school_report(result):
+    print(f"{'classes':<22}{result['classes']:>12}")
+    print(f"{'children':<22}{result['children']:>12}")
+    print(f"{'first dashboard load':<22}{result['first_ms']:>12.1f} ms")
+    print(f"{'best dashboard load':<22}{result['best_ms']:>12.1f} ms")
+    print(f"{'elements':<22}{result['elements']:>12}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("scenarios", nargs="*", help=f"scenarios to run (default: all of {', '.join(SCENARIOS)})")
+    parser.add_argument("--repeat", type=int, help="runs per scenario (default: 5, or 1 per trace with --traces)")
+    parser.add_argument("--save", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--compare", action="store_true", help="exit non-zero if a rerun regressed")
+    parser.add_argument("--threshold", type=float, default=0.1, help="allowed relative growth of elements and bytes")
+    parser.add_argument("--time-threshold", type=float, default=0.5, help="allowed relative growth of wall time")
+    parser.add_argument("--baseline", help=f"baseline file to save to or compare with (default: {os.path.basename(BASELINE_PATH)}, or {os.path.basename(TRACES_BASELINE_PATH)} with --traces)")
+    parser.add_argument("--gallery", type=int, metavar="N", help="benchmark a gallery of N drawings instead")
+    parser.add_argument("--school", type=int, metavar="N", help="benchmark the teacher dashboard for N classes instead")
+    parser.add_argument("--traces", metavar="DIR", help="replay the click traces recorded in DIR instead")
+    args = parser.parse_args(argv)
+    if args.traces:
+        args.traces = os.path.abspath(args.traces)
+    if args.repeat is None:
+        args.repeat = 1 if args.traces else 5
+    if not args.baseline:
+        args.baseline = TRACES_BASELINE_PATH if args.traces else BASELINE_PATH
+    if args.gallery:
+        print_gallery_report(run_gallery_benchmark(args.gallery))
+        return 0
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(unknown)}")
+
+    # Pick up the app's .streamlit/config.toml wherever this is run from
+    os.chdir(os.path.dirname(APP_PATH))
+    # Keep benchmark sessions out of the real progress database, event log and certificates
+    scratch = tempfile.mkdtemp(prefix="bubbles-progress-")
+    progress.DB_PATH = os.path.join(scratch, "progress.db")
+    events.EVENTS_DIR = os.path.join(scratch, "events")
+    certificates.CERTIFICATES_DIR = os.path.join(scratch, "certificates")
+    if args.school:
+        print_school_report(run_school_benchmark(args.school, repeat=args.repeat))
+        return 0
+    if args.traces:
+        report, count, skipped = run_traces(args.traces, repeat=args.repeat)
+        if not report:
+            parser.error(f"no traces in {args.traces}")
+        print(f"Replayed {count} trace(s); {skipped} click(s) didn't match the replay and were skipped\n")
+    else:
+        report = run_benchmark(args.scenarios, repeat=args.repeat)
+
+    if args.save:
+        save_baseline(report, args.baseline)
+        print_report(report)
+        print(f"\nBaseline written to {args.baseline}")
+        return 0
+
+    baseline = load_baseline(args.baseline) if args.compare else None
+    print_report(report, baseline)
+    if baseline is None:
+        return 0
+
+    regressions = compare(report, baseline, args.threshold, args.time_threshold)
+    css_size, css_ok = theme.check_budget()
+    if not css_ok:
+        regressions.append(f"static/theme.css: {css_size} bytes is over its {theme.CSS_BUDGET_BYTES} byte budget")
+    if regressions:
+        print(f"\n{len(regressions)} rerun metric(s) regressed:")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    print("\nNo rerun regressed.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,302 @@
+"""Counting and shapes played in the browser (?engine=client).
+
+In this mode a batch of rounds is shipped to a component once, and the
+browser checks answers, shows feedback and moves between rounds on its own,
+so feedback never waits on the server. Python only hears from the browser
+every few points, when the browser runs low on rounds, after a short pause,
+or when the child goes back to the menu. Then it adds the points to the
+score, records every answer (right or wrong, with the response time the
+browser measured) as an answer event, and tops the batch up with fresh
+rounds from the session's pool.
+
+Syncs carry running totals for the life of the mounted board, not deltas,
+so a sync lost to a coalesced rerun is made up by the next one. Answers are
+resent until a render acknowledges them, for the same reason.
+"""
+import streamlit as st
+
+from rounds import ROUND_TRANSITION_DELAY, next_round
+from shape_board import board_svg
+
+# Rounds the browser holds at a time
+BATCH_SIZE = 6
+# Points the browser collects before syncing, and the pause that syncs early
+SYNC_EVERY = 5
+SYNC_IDLE_MS = 2000
+# Stars shown per this many points, as in the server-side score display
+POINTS_PER_STAR = 5
+
+BROWSER_GAME_JS = """
+function el(tag, className, text) {
+    const node = document.createElement(tag);
+    if (className) node.className = className;
+    if (text !== undefined) node.textContent = text;
+    return node;
+}
+
+function setup(root, data, send) {
+    const game = {
+        kind: data.game,
+        mount: Math.random().toString(36).slice(2),
+        score: data.score,
+        points: 0,            // earned since this board was mounted
+        finished: new Set(),  // seeds of rounds played to the end
+        seen: new Set(),
+        queue: [],
+        round: null,
+        found: new Set(),
+        locked: false,
+        timer: 0,
+        unsynced: 0,
+        send: send,
+        shipped: [],
+        answers: [],          // [correct, target, response ms] not acknowledged yet
+        answersBase: 0,       // answers acknowledged before answers[0]
+        askedAt: 0,
+    };
+
+    const title = el('h2');
+    const board = el('div', 'shape-board');
+    const options = el('div', 'answer-options');
+    const feedback = el('div', 'feedback');
+    const score = el('div', 'score-display');
+    const back = el('button', 'btn-primary back-button', 'Back to Menu');
+    root.append(title, board, options, feedback, score, back);
+
+    function showScore() {
+        score.textContent = `Score: ${game.score} `;
+        for (let i = 0; i < Math.floor(game.score / data.points_per_star); i++) {
+            score.append(el('span', 'star', '⭐'));
+        }
+    }
+
+    function say(text, correct) {
+        feedback.textContent = text;
+        feedback.className = 'feedback ' + (correct ? 'correct' : 'wrong');
+    }
+
+    function sync(extra) {
+        clearTimeout(game.timer);
+        game.timer = 0;
+        game.unsynced = 0;
+        const finished = game.shipped.filter((seed) => game.finished.has(seed));
+        game.send('sync', Object.assign({
+            mount: game.mount,
+            points: game.points,
+            finished,
+            answers_base: game.answersBase,
+            answers: game.answers,
+        }, extra));
+    }
+
+    // Timed from the round being shown or the child's last answer
+    function answered(correct, target) {
+        const now = performance.now();
+        game.answers.push([correct ? 1 : 0, target, Math.round(now - game.askedAt)]);
+        game.askedAt = now;
+        if (correct) {
+            game.score += 1;
+            game.points += 1;
+            game.unsynced += 1;
+            showScore();
+        }
+        if (game.unsynced >= data.sync_every) {
+            sync();
+        } else {
+            clearTimeout(game.timer);
+            game.timer = setTimeout(sync, data.idle_ms);
+        }
+    }
+
+    function nextRound() {
+        game.round = game.queue.shift() || null;
+        game.found = new Set();
+        game.locked = false;
+        // Ask for more while there are still rounds left to play
+        if (game.queue.length < 2) sync();
+        if (!game.round) {
+            title.textContent = 'Getting more rounds ready...';
+            board.innerHTML = '';
+            options.innerHTML = '';
+            return;
+        }
+        const round = game.round;
+        game.askedAt = performance.now();
+        title.title = `Round ${round.seed}`;
+        board.innerHTML = round.svg;
+        options.innerHTML = '';
+        if (game.kind === 'counting') {
+            title.textContent = round.question;
+            for (const option of round.options) {
+                const button = el('button', 'btn-primary', String(option));
+                button.dataset.option = option;
+                options.append(button);
+            }
+        } else {
+            title.textContent = `Find all the ${round.target}s!`;
+        }
+    }
+
+    function finishRound(delay) {
+        game.finished.add(game.round.seed);
+        game.locked = true;
+        setTimeout(nextRound, delay);
+    }
+
+    options.addEventListener('click', (e) => {
+        const button = e.target.closest('[data-option]');
+        if (!button || !game.round || game.locked) return;
+        const answer = game.round.answer;
+        if (Number(button.dataset.option) === answer) {
+            say('Correct! Great job! 🎉', true);
+            answered(true, answer);
+            finishRound(0);
+        } else {
+            say(`Not quite. Try again! The answer was ${answer}.`, false);
+            answered(false, answer);
+        }
+    });
+
+    board.addEventListener('click', (e) => {
+        const shape = e.target.closest('[data-index]');
+        if (!shape || !game.round || game.locked) return;
+        const index = Number(shape.dataset.index);
+        const round = game.round;
+        if (game.found.has(index)) return;
+        if (round.targets.includes(index)) {
+            game.found.add(index);
+            shape.style.visibility = 'hidden';
+            say(`Correct! That's a ${round.target}! 🎉`, true);
+            answered(true, round.target);
+            if (game.found.size === round.targets.length) {
+                say(`Amazing! You found all the ${round.target}s! 🎉`, true);
+                finishRound(data.transition_ms);
+            }
+        } else {
+            say(`That's not a ${round.target}. Try again!`, false);
+            answered(false, round.target);
+        }
+    });
+
+    back.addEventListener('click', () => sync({ back: true }));
+
+    // New rounds arrive with every render; queue the ones not seen yet, and
+    // stop resending answers Python has recorded
+    game.receive = (rounds, applied) => {
+        if (applied.mount === game.mount && applied.answers > game.answersBase) {
+            game.answers.splice(0, applied.answers - game.answersBase);
+            game.answersBase = applied.answers;
+        }
+        game.shipped = rounds.map((round) => round.seed);
+        for (const round of rounds) {
+            if (!game.seen.has(round.seed)) {
+                game.seen.add(round.seed);
+                game.queue.push(round);
+            }
+        }
+        if (!game.round && game.queue.length) nextRound();
+    };
+
+    showScore();
+    return game;
+}
+
+export default function(component) {
+    const { data, setTriggerValue, parentElement } = component;
+    if (!parentElement.__game) {
+        parentElement.__game = setup(parentElement, data, setTriggerValue);
+    }
+    parentElement.__game.send = setTriggerValue;
+    parentElement.__game.receive(data.rounds, data.applied);
+}
+"""
+
+_browser_game_component = st.components.v2.component(
+    "browser_game",
+    js=BROWSER_GAME_JS,
+    isolate_styles=False,
+)
+
+
+def browser_engine():
+    """Whether this session plays counting and shapes in the browser"""
+    return st.query_params.get("engine") == "client"
+
+
+def _browser_round(game, round_):
+    """What the browser needs to play one round, answers included"""
+    objects = round_["objects"]
+    if game == "counting":
+        return {
+            "seed": round_["seed"],
+            "question": round_["question"],
+            "svg": board_svg(objects),
+            "options": round_["options"],
+            "answer": round_["answer"],
+        }
+    return {
+        "seed": round_["seed"],
+        "target": round_["target"],
+        "svg": board_svg(objects, clickable=True),
+        "targets": [i for i, (shape, _, _) in enumerate(objects) if shape == round_["target"]],
+    }
+
+
+def _apply_sync(game, key, on_points, on_answer, on_back):
+    """Bank what the browser reported; runs as a callback before the rerun"""
+    sync = st.session_state[key].get("sync")
+    if not sync:
+        return
+    applied = st.session_state[f"{game}_browser_applied"]
+    if applied["mount"] != sync["mount"]:
+        # A freshly mounted board counts from zero again
+        applied.update(mount=sync["mount"], points=0, answers=0)
+    if sync["points"] > applied["points"]:
+        on_points(game, sync["points"] - applied["points"])
+        applied["points"] = sync["points"]
+
+    # Answers already recorded from an earlier sync are resent until acknowledged
+    answers = sync["answers"]
+    seen = applied["answers"] - sync["answers_base"]
+    for correct, target, response_ms in answers[max(seen, 0):]:
+        on_answer(game, bool(correct), target, response_ms)
+    applied["answers"] = max(applied["answers"], sync["answers_base"] + len(answers))
+
+    finished = set(sync["finished"])
+    rounds = st.session_state[f"{game}_browser_rounds"]
+    rounds[:] = [round_ for round_ in rounds if round_["seed"] not in finished]
+    if sync.get("back"):
+        on_back()
+
+
+def browser_game(game, score, on_points, on_answer, on_back, key):
+    """Mount the in-browser game for `game` with a topped-up batch of rounds
+
+    `on_points(game, points)` is called with points earned since the last
+    sync, `on_answer(game, correct, target, response_ms)` once for every
+    answer given since then, and `on_back()` when the child leaves from the
+    board's own Back button; all run as callbacks before the rerun.
+    """
+    rounds_key = f"{game}_browser_rounds"
+    if rounds_key not in st.session_state:
+        st.session_state[rounds_key] = []
+        st.session_state[f"{game}_browser_applied"] = {"mount": None, "points": 0, "answers": 0}
+    rounds = st.session_state[rounds_key]
+    while len(rounds) < BATCH_SIZE:
+        rounds.append(next_round(game))
+
+    data = {
+        "game": game,
+        "rounds": [_browser_round(game, round_) for round_ in rounds],
+        "score": score,
+        "sync_every": SYNC_EVERY,
+        "idle_ms": SYNC_IDLE_MS,
+        "transition_ms": int(ROUND_TRANSITION_DELAY[game] * 1000),
+        "points_per_star": POINTS_PER_STAR,
+        "applied": st.session_state[f"{game}_browser_applied"],
+    }
+    _browser_game_component(
+        key=key,
+        data=data,
+        on_sync_change=lambda: _apply_sync(game, key, on_points, on_answer, on_back),
+    )
@@ -1,7 +1,31 @@
 import streamlit as st
 import random
 import json
-import time
+import html
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from admission import admit_session
+from instrumentation import instrumented, start_rerun
+from browser_games import browser_engine, browser_game
+from cards import card_html
+from certificates import CertificateCache
+from content import letter_pack, palette
+from dashboard import teacher_dashboard, teacher_view
+from drawing_canvas import apply_stroke_delta, drawing_canvas
+from events import record_answer, start_answer_clock
+from gallery import ThumbnailCache, list_drawings, save_drawing
+from progress import child_name, current_child, current_class, progress_store
+from rounds import finish_round, next_round, round_finished, schedule_next_round, top_up_rounds
+from session_store import persisted, session_key
+from shape_board import board_html, clickable_board
+from theme import load_theme
+from traces import traced
+
+# Drawings shown under the canvas, newest first
+GALLERY_PAGE = 8
+
+# Opt-in profiling (BUBBLES_METRICS=1); a no-op otherwise
+start_rerun()
 
 # Set page configuration
 st.set_page_config(
@@ -11,157 +35,24 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Custom CSS for colorful, child-friendly interface
-st.markdown("""
-<style>
-    .main-header {
-        font-size: 3rem;
-        color: #FF6B6B;
-        text-align: center;
-        margin-bottom: 1rem;
-        text-shadow: 2px 2px 4px rgba(0,0,0,0.1);
-    }
-    .game-title {
-        font-size: 2rem;
-        color: #4ECDC4;
-        text-align: center;
-        margin-bottom: 1rem;
-    }
-    .game-container {
-        background-color: #F8F9FA;
-        border-radius: 15px;
-        padding: 20px;
-        box-shadow: 0 4px 8px rgba(0,0,0,0.1);
-        margin-bottom: 20px;
-    }
-    .btn-primary {
-        background-color: #FF9F1C;
-        color: white;
-        border: none;
-        padding: 10px 20px;
-        border-radius: 25px;
-        font-size: 1.2rem;
-        cursor: pointer;
-        margin: 5px;
-        transition: all 0.3s ease;
-    }
-    .btn-primary:hover {
-        background-color: #FF8C00;
-        transform: scale(1.05);
-    }
-    .btn-secondary {
-        background-color: #8EE4AF;
-        color: white;
-        border: none;
-        padding: 10px 20px;
-        border-radius: 25px;
-        font-size: 1.2rem;
-        cursor: pointer;
-        margin: 5px;
-        transition: all 0.3s ease;
-    }
-    .btn-secondary:hover {
-        background-color: #5CDB95;
-        transform: scale(1.05);
-    }
-    .mascot {
-        font-size: 5rem;
-        text-align: center;
-        margin: 20px 0;
-    }
-    .message-bubble {
-        background-color: white;
-        border-radius: 20px;
-        padding: 15px;
-        margin: 10px 0;
-        box-shadow: 0 2px 5px rgba(0,0,0,0.1);
-        position: relative;
-    }
-    .message-bubble:after {
-        content: '';
-        position: absolute;
-        bottom: 0;
-        left: 50%;
-        width: 0;
-        height: 0;
-        border: 20px solid transparent;
-        border-top-color: white;
-        border-bottom: 0;
-        margin-left: -20px;
-        margin-bottom: -20px;
-    }
-    .score-display {
-        font-size: 1.5rem;
-        font-weight: bold;
-        color: #5D5D5D;
-        text-align: right;
-        margin: 10px 0;
-    }
-    .star {
-        color: #FFD700;
-        font-size: 2rem;
-    }
-    .canvas-container {
-        display: flex;
-        justify-content: center;
-        margin: 20px 0;
-    }
-    .color-palette {
-        display: flex;
-        justify-content: center;
-        flex-wrap: wrap;
-        margin: 10px 0;
-    }
-    .color-btn {
-        width: 40px;
-        height: 40px;
-        border-radius: 50%;
-        margin: 5px;
-        border: 2px solid #ddd;
-        cursor: pointer;
-    }
-    .brush-size-container {
-        display: flex;
-        justify-content: center;
-        margin: 10px 0;
-    }
-    .brush-btn {
-        width: 40px;
-        height: 40px;
-        border-radius: 50%;
-        margin: 5px;
-        border: 2px solid #ddd;
-        display: flex;
-        justify-content: center;
-        align-items: center;
-        cursor: pointer;
-    }
-    .shape-container {
-        display: flex;
-        flex-wrap: wrap;
-        justify-content: center;
-        margin: 20px 0;
-    }
-    .shape {
-        margin: 10px;
-        cursor: pointer;
-        transition: transform 0.2s;
-    }
-    .shape:hover {
-        transform: scale(1.1);
-    }
-</style>
-""", unsafe_allow_html=True)
+# Colorful, child-friendly theme, served once as a cached stylesheet
+load_theme()
+
+# Past the seat limit, new sessions wait their turn here
+admit_session()
 
 # Initialize session state variables
 if 'current_game' not in st.session_state:
     st.session_state.current_game = None
+# Scores carry over between visits: load this child's progress once per session
 if 'counting_score' not in st.session_state:
-    st.session_state.counting_score = 0
-if 'alphabet_score' not in st.session_state:
-    st.session_state.alphabet_score = 0
-if 'shapes_score' not in st.session_state:
-    st.session_state.shapes_score = 0
+    saved = progress_store().scores(current_child())
+    st.session_state.counting_score = saved.get("counting", 0)
+    st.session_state.alphabet_score = saved.get("alphabet", 0)
+    st.session_state.shapes_score = saved.get("shapes", 0)
+    # Class links (?class=) put the child on that class's dashboard
+    if current_class():
+        progress_store().join_class(current_child(), current_class())
 if 'mascot_message' not in st.session_state:
     st.session_state.mascot_message = "Welcome! Choose an activity to start learning!"
 if 'show_reward' not in st.session_state:
@@ -183,11 +74,11 @@ def display_mascot(message=None):
 def display_score(score_type):
     """Display the score for a specific game"""
     if score_type == "counting":
-        score = st.session_state.counting_score
+        score = st.session_state.get('counting_score', 0)
     elif score_type == "alphabet":
-        score = st.session_state.alphabet_score
+        score = st.session_state.get('alphabet_score', 0)
     elif score_type == "shapes":
-        score = st.session_state.shapes_score
+        score = st.session_state.get('shapes_score', 0)
     else:
         score = 0
     
@@ -201,63 +92,86 @@ def back_to_menu():
     """Reset current game to return to menu"""
     st.session_state.current_game = None
     st.session_state.mascot_message = "Welcome back! Choose another activity!"
+    # The drawing canvas unmounts with its game; it needs the strokes when it's back
+    st.session_state.drawing_restore = True
+    # Leaving a game is a good moment to write its scores out
+    progress_store().request_flush()
+
+def save_score(game):
+    """Queue a game's score for the progress store; written in the background"""
+    progress_store().record(current_child(), game, st.session_state[f"{game}_score"])
+
+def add_points(game, points):
+    """Add points earned outside a script run (e.g. in the browser) to a game's score"""
+    st.session_state[f"{game}_score"] = st.session_state.get(f"{game}_score", 0) + points
+    save_score(game)
+
+def total_score():
+    """The child's total across all games, read from the progress store"""
+    return sum(progress_store().scores(current_child()).values())
+
+@st.cache_resource
+def thumbnail_cache():
+    """Gallery thumbnails, shared by every session in this process"""
+    return ThumbnailCache()
+
+@st.cache_resource
+def certificate_cache():
+    """Certificate PDFs, rendered by worker processes and cached on disk"""
+    return CertificateCache()
+
+def rerun_board():
+    """Rerun only the current game board; a full run if the click came in one"""
+    ctx = get_script_run_ctx()
+    if ctx and ctx.fragment_ids_this_run:
+        st.rerun(scope="fragment")
+    st.rerun()
 
+@instrumented
 def counting_game():
     """Counting game implementation"""
     st.markdown('<h1 class="game-title">Counting Game</h1>', unsafe_allow_html=True)
-    
-    # Generate random objects to count
+    if browser_engine():
+        browser_board("counting")
+    else:
+        counting_board()
+
+@st.fragment
+@persisted
+@traced
+@instrumented
+def counting_board():
+    """Counting round, answers and score; answer clicks rerun only this fragment"""
+    # Start a new round from the pre-generated pool
     if 'counting_objects' not in st.session_state or 'counting_question' not in st.session_state:
-        count = random.randint(3, 10)
-        shapes = ['circle', 'square', 'triangle', 'star']
-        colors = ['red', 'green', 'blue', 'yellow', 'purple', 'orange']
-        
-        objects = []
-        for _ in range(count):
-            obj_shape = random.choice(shapes)
-            obj_color = random.choice(colors)
-            objects.append((obj_shape, obj_color))
-        
-        st.session_state.counting_objects = objects
-        st.session_state.counting_answer = count
-        st.session_state.counting_question = f"How many {random.choice(['shapes', 'circles', 'squares', 'triangles', 'stars'])} do you see?"
+        round_ = next_round("counting")
+        st.session_state.counting_objects = round_["objects"]
+        st.session_state.counting_answer = round_["answer"]
+        st.session_state.counting_question = round_["question"]
+        st.session_state.counting_options = round_["options"]
+        st.session_state.counting_round = round_["seed"]
         st.session_state.counting_feedback = None
+        start_answer_clock("counting")
     
-    # Display the question
-    st.markdown(f'<h2>{st.session_state.counting_question}</h2>', unsafe_allow_html=True)
-    
-    # Display the objects
-    cols = st.columns(5)
-    for i, (shape, color) in enumerate(st.session_state.counting_objects):
-        with cols[i % 5]:
-            if shape == 'circle':
-                st.markdown(f'<div style="width:100px;height:100px;background-color:{color};border-radius:50%;margin:10px auto;"></div>', unsafe_allow_html=True)
-            elif shape == 'square':
-                st.markdown(f'<div style="width:100px;height:100px;background-color:{color};margin:10px auto;"></div>', unsafe_allow_html=True)
-            elif shape == 'triangle':
-                st.markdown(f'<div style="width:0;height:0;border-left:50px solid transparent;border-right:50px solid transparent;border-bottom:100px solid {color};margin:10px auto;"></div>', unsafe_allow_html=True)
-            elif shape == 'star':
-                st.markdown(f'<div style="font-size:100px;color:{color};text-align:center;margin:10px auto;">⭐</div>', unsafe_allow_html=True)
-    
-    # Create answer options
-    correct_answer = st.session_state.counting_answer
-    wrong_options = [correct_answer - 1, correct_answer + 1, correct_answer + 2]
-    wrong_options = [opt for opt in wrong_options if opt > 0 and opt != correct_answer]
+    # Display the question (the round seed is in the tooltip for bug reports)
+    st.markdown(f'<h2 title="Round {st.session_state.counting_round}">{st.session_state.counting_question}</h2>', unsafe_allow_html=True)
     
-    if len(wrong_options) < 3:
-        wrong_options.extend([correct_answer - 2, correct_answer + 3, correct_answer - 3])
-        wrong_options = [opt for opt in wrong_options if opt > 0 and opt != correct_answer]
+    # Display the objects as one board
+    st.markdown(board_html(st.session_state.counting_objects), unsafe_allow_html=True)
     
-    options = [correct_answer] + random.sample(wrong_options, min(3, len(wrong_options)))
-    random.shuffle(options)
+    # Answer options were fixed when the round was generated
+    correct_answer = st.session_state.counting_answer
+    options = st.session_state.counting_options
     
     # Display answer options
     cols = st.columns(len(options))
     for i, option in enumerate(cols):
         with option:
             if st.button(str(options[i]), key=f"counting_option_{i}"):
+                record_answer("counting", options[i] == correct_answer, correct_answer)
                 if options[i] == correct_answer:
                     st.session_state.counting_score += 1
+                    save_score("counting")
                     st.session_state.counting_feedback = "Correct! Great job! 🎉"
                     st.session_state.mascot_message = "You're doing great! Keep counting!"
                     # Generate new question
@@ -268,14 +182,14 @@ def counting_game():
                 else:
                     st.session_state.counting_feedback = f"Not quite. Try again! The answer was {correct_answer}."
                     st.session_state.mascot_message = "Don't worry, you'll get it next time!"
-                st.rerun()
+                rerun_board()
     
     # Display feedback
     if st.session_state.counting_feedback:
         if "Correct" in st.session_state.counting_feedback:
-            st.markdown(f'<div style="color:green;font-size:1.5rem;text-align:center;">{st.session_state.counting_feedback}</div>', unsafe_allow_html=True)
+            st.markdown(f'<div class="feedback correct">{st.session_state.counting_feedback}</div>', unsafe_allow_html=True)
         else:
-            st.markdown(f'<div style="color:red;font-size:1.5rem;text-align:center;">{st.session_state.counting_feedback}</div>', unsafe_allow_html=True)
+            st.markdown(f'<div class="feedback wrong">{st.session_state.counting_feedback}</div>', unsafe_allow_html=True)
     
     # Display score
     display_score("counting")
@@ -284,61 +198,71 @@ def counting_game():
     if st.button("Back to Menu", key="counting_back"):
         back_to_menu()
         st.rerun()
+    
+    # Queue up more rounds now that the board is on screen
+    top_up_rounds("counting")
 
+@instrumented
 def alphabet_game():
     """Alphabet learning game implementation"""
     st.markdown('<h1 class="game-title">Alphabet Learning</h1>', unsafe_allow_html=True)
-    
-    # Initialize current letter
-    if 'current_letter' not in st.session_state:
-        st.session_state.current_letter = 'A'
-    
-    # Word examples for each letter
-    word_examples = {
-        'A': 'Apple', 'B': 'Ball', 'C': 'Cat', 'D': 'Dog', 'E': 'Elephant',
-        'F': 'Fish', 'G': 'Goat', 'H': 'Hat', 'I': 'Ice cream', 'J': 'Jump',
-        'K': 'Kite', 'L': 'Lion', 'M': 'Moon', 'N': 'Nest', 'O': 'Orange',
-        'P': 'Penguin', 'Q': 'Queen', 'R': 'Rainbow', 'S': 'Sun', 'T': 'Tree',
-        'U': 'Umbrella', 'V': 'Violin', 'W': 'Water', 'X': 'Xylophone', 'Y': 'Yacht', 'Z': 'Zebra'
-    }
+    alphabet_board()
+
+@st.fragment
+@persisted
+@traced
+@instrumented
+def alphabet_board():
+    """Letter, word and navigation; clicks rerun only this fragment"""
+    # Letters and words for the child's language (?lang=), shared by every session
+    letters = letter_pack()
+    
+    # Initialize current letter, and start over if it isn't in this language
+    if st.session_state.get('current_letter') not in letters["index"]:
+        st.session_state.current_letter = letters["order"][0]
+        start_answer_clock("alphabet")
+    position = letters["index"][st.session_state.current_letter]
     
     # Display the current letter
-    colors = ['red', 'green', 'blue', 'yellow', 'purple', 'orange']
-    letter_color = random.choice(colors)
+    letter_color = random.choice(palette("letters"))
+    word = letters["words"][st.session_state.current_letter][0]
+    show_word = st.session_state.get('show_word', False)
     
-    st.markdown(f'<div style="font-size:10rem;color:{letter_color};text-align:center;font-weight:bold;">{st.session_state.current_letter}</div>', unsafe_allow_html=True)
+    # Load the cards Show Word and Next will need while this letter is on screen
+    next_letter = letters["order"][(position + 1) % len(letters["order"])]
+    upcoming = [letters["words"][next_letter][0]] if show_word else [word, letters["words"][next_letter][0]]
+    prefetch = "".join(card_html(upcoming_word, hidden=True) for upcoming_word in upcoming)
+    
+    st.markdown(f'<div style="font-size:10rem;color:{letter_color};text-align:center;font-weight:bold;">{st.session_state.current_letter}</div>{prefetch}', unsafe_allow_html=True)
     
     # Show word example if requested
-    if 'show_word' in st.session_state and st.session_state.show_word:
-        word = word_examples.get(st.session_state.current_letter, '')
-        st.markdown(f'<div style="font-size:2rem;text-align:center;">{word}</div>', unsafe_allow_html=True)
+    if show_word:
+        st.markdown(f'<div style="font-size:2rem;text-align:center;">{card_html(word)}{word}</div>', unsafe_allow_html=True)
     
     # Navigation buttons
     col1, col2, col3 = st.columns(3)
     with col1:
         if st.button("Previous", key="alphabet_prev"):
-            if st.session_state.current_letter == 'A':
-                st.session_state.current_letter = 'Z'
-            else:
-                st.session_state.current_letter = chr(ord(st.session_state.current_letter) - 1)
+            st.session_state.current_letter = letters["order"][position - 1]
             st.session_state.show_word = False
-            st.rerun()
+            start_answer_clock("alphabet")
+            rerun_board()
     
     with col2:
         if st.button("Show Word", key="alphabet_word"):
+            record_answer("alphabet", True, st.session_state.current_letter)
             st.session_state.show_word = True
             st.session_state.alphabet_score += 1
+            save_score("alphabet")
             st.session_state.mascot_message = f"Great job learning the letter {st.session_state.current_letter}!"
-            st.rerun()
+            rerun_board()
     
     with col3:
         if st.button("Next", key="alphabet_next"):
-            if st.session_state.current_letter == 'Z':
-                st.session_state.current_letter = 'A'
-            else:
-                st.session_state.current_letter = chr(ord(st.session_state.current_letter) + 1)
+            st.session_state.current_letter = letters["order"][(position + 1) % len(letters["order"])]
             st.session_state.show_word = False
-            st.rerun()
+            start_answer_clock("alphabet")
+            rerun_board()
     
     # Display score
     display_score("alphabet")
@@ -348,206 +272,155 @@ def alphabet_game():
         back_to_menu()
         st.rerun()
 
+@instrumented
 def drawing_game():
-    """Drawing canvas implementation using HTML5 Canvas"""
+    """Drawing canvas implementation using a persistent HTML5 canvas component"""
     st.markdown('<h1 class="game-title">Drawing Canvas</h1>', unsafe_allow_html=True)
     
     # Instructions
     st.markdown('<div style="font-size:1.2rem;text-align:center;margin-bottom:20px;">Click and drag to draw. Select colors and brush sizes below.</div>', unsafe_allow_html=True)
     
-    # HTML5 Canvas for drawing
-    drawing_code = """
-    <div class="canvas-container">
-        <canvas id="drawingCanvas" width="800" height="400" style="border:2px solid #ddd;border-radius:10px;"></canvas>
-    </div>
-    
-    <div class="color-palette">
-        <div class="color-btn" style="background-color:black;" onclick="changeColor('black')"></div>
-        <div class="color-btn" style="background-color:red;" onclick="changeColor('red')"></div>
-        <div class="color-btn" style="background-color:green;" onclick="changeColor('green')"></div>
-        <div class="color-btn" style="background-color:blue;" onclick="changeColor('blue')"></div>
-        <div class="color-btn" style="background-color:yellow;" onclick="changeColor('yellow')"></div>
-        <div class="color-btn" style="background-color:purple;" onclick="changeColor('purple')"></div>
-        <div class="color-btn" style="background-color:orange;" onclick="changeColor('orange')"></div>
-        <div class="color-btn" style="background-color:pink;" onclick="changeColor('pink')"></div>
-        <div class="color-btn" style="background-color:brown;" onclick="changeColor('brown')"></div>
-        <div class="color-btn" style="background-color:white;" onclick="changeColor('white')"></div>
-    </div>
+    drawing_board()
     
-    <div class="brush-size-container">
-        <div class="brush-btn" onclick="changeBrushSize(2)"><div style="width:2px;height:2px;background-color:black;border-radius:50%;"></div></div>
-        <div class="brush-btn" onclick="changeBrushSize(5)"><div style="width:5px;height:5px;background-color:black;border-radius:50%;"></div></div>
-        <div class="brush-btn" onclick="changeBrushSize(10)"><div style="width:10px;height:10px;background-color:black;border-radius:50%;"></div></div>
-        <div class="brush-btn" onclick="changeBrushSize(15)"><div style="width:15px;height:15px;background-color:black;border-radius:50%;"></div></div>
-        <div class="brush-btn" onclick="changeBrushSize(20)"><div style="width:20px;height:20px;background-color:black;border-radius:50%;"></div></div>
-    </div>
-    
-    <div style="text-align:center;margin-top:20px;">
-        <button class="btn-primary" onclick="clearCanvas()">Clear Canvas</button>
-    </div>
-    
-    <script>
-        const canvas = document.getElementById('drawingCanvas');
-        const ctx = canvas.getContext('2d');
-        
-        // Set canvas background
-        ctx.fillStyle = 'white';
-        ctx.fillRect(0, 0, canvas.width, canvas.height);
-        
-        let isDrawing = false;
-        let currentColor = 'black';
-        let currentSize = 5;
-        
-        canvas.addEventListener('mousedown', startDrawing);
-        canvas.addEventListener('mousemove', draw);
-        canvas.addEventListener('mouseup', stopDrawing);
-        canvas.addEventListener('mouseout', stopDrawing);
-        
-        function startDrawing(e) {
-            isDrawing = true;
-            const rect = canvas.getBoundingClientRect();
-            const x = e.clientX - rect.left;
-            const y = e.clientY - rect.top;
-            
-            ctx.beginPath();
-            ctx.moveTo(x, y);
-        }
-        
-        function draw(e) {
-            if (!isDrawing) return;
-            
-            const rect = canvas.getBoundingClientRect();
-            const x = e.clientX - rect.left;
-            const y = e.clientY - rect.top;
-            
-            ctx.lineWidth = currentSize;
-            ctx.lineCap = 'round';
-            ctx.strokeStyle = currentColor;
-            
-            ctx.lineTo(x, y);
-            ctx.stroke();
-            ctx.beginPath();
-            ctx.moveTo(x, y);
-        }
-        
-        function stopDrawing() {
-            if (!isDrawing) return;
-            isDrawing = false;
-            ctx.beginPath();
-        }
-        
-        function changeColor(color) {
-            currentColor = color;
-        }
-        
-        function changeBrushSize(size) {
-            currentSize = size;
-        }
-        
-        function clearCanvas() {
-            ctx.clearRect(0, 0, canvas.width, canvas.height);
-            ctx.fillStyle = 'white';
-            ctx.fillRect(0, 0, canvas.width, canvas.height);
-        }
-    </script>
-    """
+    # Keep the drawing in this child's gallery
+    if st.button("Save to Gallery", key="drawing_save"):
+        if st.session_state.drawing_strokes:
+            save_drawing(current_child(), st.session_state.drawing_strokes)
+            display_mascot("What a beautiful drawing! It's in your gallery now.")
+        else:
+            display_mascot("Draw something first, then save it!")
     
-    st.components.v1.html(drawing_code, height=600)
+    drawing_gallery()
     
     # Back button
     if st.button("Back to Menu", key="drawing_back"):
         back_to_menu()
         st.rerun()
 
+@st.fragment
+@persisted
+@traced
+@instrumented
+def drawing_board():
+    """Drawing canvas; stroke syncs rerun only this fragment"""
+    if 'drawing_strokes' not in st.session_state:
+        st.session_state.drawing_strokes = []
+    
+    # The canvas only gets the saved strokes when it is mounted fresh: a new
+    # session (e.g. a reload) or coming back from the menu
+    delta, cleared = drawing_canvas(
+        st.session_state.drawing_strokes,
+        restore=st.session_state.get('drawing_restore', True),
+        resync=st.session_state.get('drawing_resync', 0),
+        snapshot_key=f"{current_child()}:{session_key()}",
+        key="drawing_canvas",
+    )
+    st.session_state.drawing_restore = False
+    
+    # Keep Python's copy of the drawing in step with the browser
+    if cleared:
+        st.session_state.drawing_strokes = []
+    if delta and not apply_stroke_delta(st.session_state.drawing_strokes, delta):
+        # A batch went missing: have the canvas send everything again
+        st.session_state.drawing_resync = st.session_state.get('drawing_resync', 0) + 1
+        rerun_board()
+
+@instrumented
+def drawing_gallery():
+    """The child's latest saved drawings; thumbnails fill in as they render"""
+    child = current_child()
+    # Only the gallery index is read here; stroke files are decoded by the worker
+    entries = list_drawings(child)[:GALLERY_PAGE]
+    if not entries:
+        return
+    
+    st.markdown('<h3 style="text-align:center;">My Gallery</h3>', unsafe_allow_html=True)
+    waiting = [thumbnail_cache().get(child, entry["id"]) is None for entry in entries]
+    
+    @st.fragment(run_every=1 if any(waiting) else None)
+    def gallery_grid():
+        thumbnails = [thumbnail_cache().get(child, entry["id"]) for entry in entries]
+        cols = st.columns(4)
+        for i, png in enumerate(thumbnails):
+            with cols[i % 4]:
+                if png is None:
+                    st.markdown('<div class="thumbnail-placeholder">🎨</div>', unsafe_allow_html=True)
+                else:
+                    st.image(png, width="stretch")
+        # Everything rendered: one full run drops the polling timer
+        if any(waiting) and None not in thumbnails and get_script_run_ctx().fragment_ids_this_run:
+            st.rerun()
+    
+    gallery_grid()
+
+def clear_shapes_round():
+    """Drop the finished shapes round so the next one is popped from the pool"""
+    if 'shapes_game_objects' in st.session_state:
+        del st.session_state.shapes_game_objects
+    if 'target_shape' in st.session_state:
+        del st.session_state.target_shape
+    st.session_state.found_shapes = set()
+
+@instrumented
 def shapes_game():
     """Shape recognition game implementation"""
     st.markdown('<h1 class="game-title">Shape Recognition</h1>', unsafe_allow_html=True)
-    
-    # Generate random shapes
+    if browser_engine():
+        browser_board("shapes")
+    else:
+        shapes_board()
+
+@st.fragment
+@persisted
+@traced
+@instrumented
+def shapes_board():
+    """Shapes round, feedback and score; clicks rerun only this fragment"""
+    # Start a new round from the pre-generated pool
     if 'shapes_game_objects' not in st.session_state or 'target_shape' not in st.session_state:
-        shape_types = ['circle', 'square', 'triangle', 'star', 'rectangle', 'diamond']
-        colors = ['red', 'green', 'blue', 'yellow', 'purple', 'orange']
-        
-        target_shape = random.choice(shape_types)
-        objects = []
-        
-        # Generate 6-10 random shapes
-        num_shapes = random.randint(6, 10)
-        for _ in range(num_shapes):
-            shape_type = random.choice(shape_types)
-            color = random.choice(colors)
-            size = random.randint(40, 80)
-            objects.append((shape_type, color, size))
-        
-        # Ensure at least one target shape exists
-        if not any(obj[0] == target_shape for obj in objects):
-            idx = random.randint(0, len(objects) - 1)
-            objects[idx] = (target_shape, objects[idx][1], objects[idx][2])
-        
-        st.session_state.shapes_game_objects = objects
-        st.session_state.target_shape = target_shape
+        round_ = next_round("shapes")
+        st.session_state.shapes_game_objects = round_["objects"]
+        st.session_state.target_shape = round_["target"]
+        st.session_state.shapes_round = round_["seed"]
         st.session_state.shapes_feedback = None
-        st.session_state.found_shapes = []
+        st.session_state.found_shapes = set()
+        start_answer_clock("shapes")
     
     # Display the question
-    st.markdown(f'<h2>Find all the {st.session_state.target_shape}s!</h2>', unsafe_allow_html=True)
-    
-    # Display the shapes
-    cols = st.columns(5)
-    for i, (shape_type, color, size) in enumerate(st.session_state.shapes_game_objects):
-        with cols[i % 5]:
-            # Create a unique key for each shape button
-            shape_key = f"shape_{i}"
-            
-            # Skip if this shape has already been found
-            if i in st.session_state.found_shapes:
-                st.markdown(f'<div style="width:100px;height:100px;margin:10px auto;opacity:0.3;"></div>', unsafe_allow_html=True)
-                continue
+    st.markdown(f'<h2 title="Round {st.session_state.shapes_round}">Find all the {st.session_state.target_shape}s!</h2>', unsafe_allow_html=True)
+    
+    # Display the shapes as one clickable board
+    clicked = clickable_board(st.session_state.shapes_game_objects, st.session_state.found_shapes, key="shape_board")
+    if clicked is not None and clicked not in st.session_state.found_shapes and not round_finished("shapes"):
+        shape_type = st.session_state.shapes_game_objects[clicked][0]
+        record_answer("shapes", shape_type == st.session_state.target_shape, st.session_state.target_shape)
+        if shape_type == st.session_state.target_shape:
+            st.session_state.shapes_score += 1
+            save_score("shapes")
+            st.session_state.shapes_feedback = f"Correct! That's a {shape_type}! 🎉"
+            st.session_state.mascot_message = "Great job finding the shapes!"
+            st.session_state.found_shapes.add(clicked)
             
-            # Create a button for each shape
-            if shape_type == 'circle':
-                shape_html = f'<div style="width:{size}px;height:{size}px;background-color:{color};border-radius:50%;margin:10px auto;"></div>'
-            elif shape_type == 'square':
-                shape_html = f'<div style="width:{size}px;height:{size}px;background-color:{color};margin:10px auto;"></div>'
-            elif shape_type == 'rectangle':
-                shape_html = f'<div style="width:{size}px;height:{size//2}px;background-color:{color};margin:10px auto;"></div>'
-            elif shape_type == 'triangle':
-                shape_html = f'<div style="width:0;height:0;border-left:{size//2}px solid transparent;border-right:{size//2}px solid transparent;border-bottom:{size}px solid {color};margin:10px auto;"></div>'
-            elif shape_type == 'star':
-                shape_html = f'<div style="font-size:{size}px;color:{color};text-align:center;margin:10px auto;">⭐</div>'
-            elif shape_type == 'diamond':
-                shape_html = f'<div style="width:0;height:0;border-left:{size//2}px solid transparent;border-right:{size//2}px solid transparent;border-bottom:{size}px solid {color};margin:10px auto;position:relative;"></div><div style="width:0;height:0;border-left:{size//2}px solid transparent;border-right:{size//2}px solid transparent;border-top:{size}px solid {color};margin-top:-{size//2}px;position:relative;"></div>'
-            
-            # Use a button with the shape as HTML
-            if st.button(shape_html, key=shape_key):
-                if shape_type == st.session_state.target_shape:
-                    st.session_state.shapes_score += 1
-                    st.session_state.shapes_feedback = f"Correct! That's a {shape_type}! 🎉"
-                    st.session_state.mascot_message = "Great job finding the shapes!"
-                    st.session_state.found_shapes.append(i)
-                    
-                    # Check if all target shapes have been found
-                    target_shapes = [i for i, (s, _, _) in enumerate(st.session_state.shapes_game_objects) if s == st.session_state.target_shape]
-                    if all(idx in st.session_state.found_shapes for idx in target_shapes):
-                        st.session_state.shapes_feedback = f"Amazing! You found all the {st.session_state.target_shape}s! 🎉"
-                        # Generate new shapes after a delay
-                        time.sleep(2)
-                        if 'shapes_game_objects' in st.session_state:
-                            del st.session_state.shapes_game_objects
-                        if 'target_shape' in st.session_state:
-                            del st.session_state.target_shape
-                        st.session_state.found_shapes = []
-                else:
-                    st.session_state.shapes_feedback = f"That's not a {st.session_state.target_shape}. Try again!"
-                    st.session_state.mascot_message = "Look carefully at the shapes!"
-                st.rerun()
+            # Check if all target shapes have been found (only targets are ever found)
+            if len(st.session_state.found_shapes) == st.session_state.shapes_game_objects.count(st.session_state.target_shape):
+                st.session_state.shapes_feedback = f"Amazing! You found all the {st.session_state.target_shape}s! 🎉"
+                # Celebrate, then generate new shapes without holding the script thread
+                finish_round("shapes")
+        else:
+            st.session_state.shapes_feedback = f"That's not a {st.session_state.target_shape}. Try again!"
+            st.session_state.mascot_message = "Look carefully at the shapes!"
+        rerun_board()
     
     # Display feedback
     if st.session_state.shapes_feedback:
         if "Correct" in st.session_state.shapes_feedback or "Amazing" in st.session_state.shapes_feedback:
-            st.markdown(f'<div style="color:green;font-size:1.5rem;text-align:center;">{st.session_state.shapes_feedback}</div>', unsafe_allow_html=True)
+            st.markdown(f'<div class="feedback correct">{st.session_state.shapes_feedback}</div>', unsafe_allow_html=True)
         else:
-            st.markdown(f'<div style="color:red;font-size:1.5rem;text-align:center;">{st.session_state.shapes_feedback}</div>', unsafe_allow_html=True)
+            st.markdown(f'<div class="feedback wrong">{st.session_state.shapes_feedback}</div>', unsafe_allow_html=True)
+    
+    # Move on to new shapes once the celebration is over
+    if round_finished("shapes"):
+        schedule_next_round("shapes", clear_shapes_round)
     
     # Display score
     display_score("shapes")
@@ -556,27 +429,65 @@ def shapes_game():
     if st.button("Back to Menu", key="shapes_back"):
         back_to_menu()
         st.rerun()
+    
+    # Queue up more rounds now that the board is on screen
+    top_up_rounds("shapes")
+
+@st.fragment
+@persisted
+@traced
+@instrumented
+def browser_board(game):
+    """Counting or shapes played in the browser; score syncs rerun only this fragment"""
+    browser_game(game, st.session_state.get(f"{game}_score", 0), on_points=add_points, on_answer=record_answer, on_back=back_to_menu, key=f"{game}_browser")
+    
+    # The board's own Back button left the game; draw the menu
+    if st.session_state.get('current_game') != game:
+        st.rerun()
 
+@instrumented
+def certificate_download(name, total):
+    """Download button for the certificate PDF, shown once a worker has rendered it"""
+    ready = certificate_cache().get(name, total) is not None
+    
+    @st.fragment(run_every=1 if not ready else None)
+    def certificate_button():
+        pdf = certificate_cache().get(name, total)
+        if pdf is None:
+            st.markdown('<p style="text-align:center;">Getting your certificate ready... ✨</p>', unsafe_allow_html=True)
+            return
+        st.download_button("Download Certificate", pdf, file_name=f"certificate-{child_name()}.pdf", mime="application/pdf", on_click="ignore", key="certificate_download")
+        # Rendered: one full run drops the polling timer
+        if not ready and get_script_run_ctx().fragment_ids_this_run:
+            st.rerun()
+    
+    certificate_button()
+
+@instrumented
 def reward_screen():
     """Reward screen after completing activities"""
     st.markdown('<h1 class="main-header">Congratulations! 🎉</h1>', unsafe_allow_html=True)
     
-    total_score = st.session_state.counting_score + st.session_state.alphabet_score + st.session_state.shapes_score
+    total = total_score()
+    name = child_name().title()
     
     # Display certificate
     st.markdown(f"""
     <div class="game-container">
         <h2 style="text-align:center;color:#4ECDC4;">Certificate of Achievement</h2>
+        <p style="font-size:1.5rem;text-align:center;">Awarded to <b>{html.escape(name)}</b></p>
         <p style="font-size:1.5rem;text-align:center;">For excellent performance in learning!</p>
         <div style="text-align:center;margin:20px 0;">
             <span class="star">⭐</span>
             <span class="star">⭐</span>
             <span class="star">⭐</span>
         </div>
-        <h3 style="text-align:center;">Total Score: {total_score}</h3>
+        <h3 style="text-align:center;">Total Score: {total}</h3>
     </div>
     """, unsafe_allow_html=True)
     
+    certificate_download(name, total)
+    
     # Display mascot with congratulatory message
     display_mascot("You're a learning superstar! Keep up the great work!")
     
@@ -587,7 +498,15 @@ def reward_screen():
         st.rerun()
 
 # Main application
+@persisted
+@traced
+@instrumented
 def main():
+    # Teachers open the app with ?view=teacher
+    if teacher_view():
+        teacher_dashboard()
+        return
+    
     # Display header
     st.markdown('<h1 class="main-header">Kids Learning Adventure</h1>', unsafe_allow_html=True)
     
@@ -639,15 +558,15 @@ def main():
         st.markdown('</div>', unsafe_allow_html=True)
         
         # Total score and reward button
-        total_score = st.session_state.counting_score + st.session_state.alphabet_score + st.session_state.shapes_score
+        total = total_score()
         
         st.markdown(f"""
         <div class="score-display">
-            Total Score: {total_score} {'<span class="star">⭐</span>' * (total_score // 10)}
+            Total Score: {total} {'<span class="star">⭐</span>' * (total // 10)}
         </div>
         """, unsafe_allow_html=True)
         
-        if total_score >= 10:
+        if total >= 10:
             if st.button("View Certificate", key="view_certificate"):
                 st.session_state.show_reward = True
                 st.rerun()
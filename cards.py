@@ -0,0 +1,213 @@
+"""Picture cards for the alphabet's words, built ahead of time.
+
+    python cards.py        # build cards for every word in content/letters-*.json
+
+Each word gets its card from one of two sources:
+
+    pictures/<word>.png|.jpg|.jpeg|.webp   a picture, resized to each of CARD_WIDTHS
+                                           and compressed as WebP (needs Pillow)
+    content/pictures.json                  otherwise the word's emoji as an SVG,
+                                           which is sharp at every width by itself
+
+Files are written to static/cards/ under a hash of their bytes, so a URL never
+changes what it serves: browsers may keep a card for good, and words that
+share a picture share the file. content/cards.json lists each word's files
+and is read like the other content packs:
+
+    {"<word>": {"src": "<file>", "srcset": {"<file>": <pixel width>, ...}}}
+
+`src` is the file for browsers without srcset, and `srcset` the WebP files
+with the width each really is (a small picture is never scaled up, so
+several requested widths can end up as one file). Emoji cards have no
+srcset. Files cards.json no longer lists are deleted.
+
+The alphabet shows a card with srcset, so each tablet downloads only the
+width it displays, and loads the next letter's card in a hidden <img> while
+the current one is on screen. The launcher serves static/cards/ with a
+one-year immutable Cache-Control (see immutable_cards).
+"""
+import argparse
+import glob
+import hashlib
+import html
+import io
+import json
+import os
+
+from content import CONTENT_DIR, content_pack
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CARDS_DIR = os.path.join(HERE, "static", "cards")
+CARDS_URL = "app/static/cards"
+PICTURES_DIR = os.path.join(HERE, "pictures")
+PICTURE_TYPES = (".png", ".jpg", ".jpeg", ".webp")
+
+# Widths made of every picture, and how wide a card shows per screen size
+CARD_WIDTHS = (160, 320, 640)
+CARD_SIZES = "(max-width: 640px) 160px, 320px"
+WEBP_QUALITY = 80
+
+CACHE_CONTROL = b"public, max-age=31536000, immutable"
+
+SVG_CARD = (
+    '<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 100 100">'
+    '<rect x="2" y="2" width="96" height="96" rx="16" fill="#fffaeb" stroke="#4ecdc4" stroke-width="3"/>'
+    '<text x="50" y="54" font-size="62" text-anchor="middle" dominant-baseline="middle">{emoji}</text>'
+    '</svg>'
+)
+
+
+def emoji_card(emoji):
+    """SVG bytes of a card showing an emoji"""
+    return SVG_CARD.format(emoji=html.escape(emoji)).encode("utf-8")
+
+
+def picture_variants(path, widths=CARD_WIDTHS):
+    """{width: (pixel width, WebP bytes)} of a picture resized to each width, or None without Pillow"""
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    variants = {}
+    with Image.open(path) as image:
+        image = image.convert("RGBA")
+        for width in widths:
+            # Never scale up; a small picture is sent as it is
+            height = round(image.height * min(width, image.width) / image.width)
+            resized = image.resize((min(width, image.width), height), Image.LANCZOS)
+            out = io.BytesIO()
+            resized.save(out, "WEBP", quality=WEBP_QUALITY, method=6)
+            variants[width] = (resized.width, out.getvalue())
+    return variants
+
+
+def _store(data, extension, directory):
+    """Write `data` under its content hash unless it's already there; returns the file name"""
+    name = f"{hashlib.sha256(data).hexdigest()[:16]}{extension}"
+    path = os.path.join(directory, name)
+    if not os.path.exists(path):
+        with open(path + ".tmp", "wb") as f:
+            f.write(data)
+        os.replace(path + ".tmp", path)
+    return name
+
+
+def _words(content_dir):
+    """Every word in every letter pack"""
+    words = {}
+    for path in sorted(glob.glob(os.path.join(content_dir, "letters-*.json"))):
+        with open(path, encoding="utf-8") as f:
+            for letter_words in json.load(f)["letters"].values():
+                words.update(dict.fromkeys(letter_words))
+    return list(words)
+
+
+def _picture(word, pictures_dir):
+    for extension in PICTURE_TYPES:
+        path = os.path.join(pictures_dir, word + extension)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def card_files(card):
+    """Every file a cards.json entry uses"""
+    return {card["src"], *card.get("srcset", ())}
+
+
+def build_cards(content_dir=CONTENT_DIR, pictures_dir=PICTURES_DIR, out_dir=CARDS_DIR):
+    """Build every word's card, write content/cards.json and return it"""
+    with open(os.path.join(content_dir, "pictures.json"), encoding="utf-8") as f:
+        emojis = json.load(f)
+    os.makedirs(out_dir, exist_ok=True)
+
+    cards = {}
+    for word in _words(content_dir):
+        picture = _picture(word, pictures_dir)
+        variants = picture_variants(picture) if picture else None
+        if variants:
+            names = {width: _store(data, ".webp", out_dir) for width, (_, data) in variants.items()}
+            cards[word] = {
+                "src": names[CARD_WIDTHS[1]],
+                "srcset": {names[width]: pixels for width, (pixels, _) in variants.items()},
+            }
+        elif word in emojis:
+            cards[word] = {"src": _store(emoji_card(emojis[word]), ".svg", out_dir)}
+
+    with open(os.path.join(content_dir, "cards.json"), "w", encoding="utf-8", newline="\n") as f:
+        json.dump(cards, f, ensure_ascii=False, indent=1, sort_keys=True)
+        f.write("\n")
+    used = set().union(*map(card_files, cards.values()))
+    for name in os.listdir(out_dir):
+        if name not in used:
+            os.remove(os.path.join(out_dir, name))
+    return cards
+
+
+def card_html(word, hidden=False):
+    """<img> of a word's card, or "" if it has none; `hidden` only loads it"""
+    try:
+        card = content_pack("cards").get(word)
+    except FileNotFoundError:
+        return ""
+    if not card:
+        return ""
+    sources = f'src="{CARDS_URL}/{card["src"]}"'
+    # One file for every width (an SVG, or a picture smaller than them all) needs no srcset
+    if len(card.get("srcset", ())) > 1:
+        srcset = ", ".join(f"{CARDS_URL}/{name} {width}w" for name, width in card["srcset"].items())
+        sources += f' srcset="{srcset}" sizes="{CARD_SIZES}"'
+    if hidden:
+        return f'<img {sources} alt="" hidden fetchpriority="low">'
+    return f'<img class="word-card" {sources} alt="{html.escape(word)}">'
+
+
+class ImmutableCards:
+    """ASGI middleware giving responses from static/cards/ a long-lived Cache-Control"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or "/app/static/cards/" not in scope["path"]:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_cached(message):
+            if message["type"] == "http.response.start" and message["status"] == 200:
+                headers = [(k, v) for k, v in message.get("headers", []) if k.lower() != b"cache-control"]
+                message = {**message, "headers": headers + [(b"cache-control", CACHE_CONTROL)]}
+            await send(message)
+
+        await self.app(scope, receive, send_cached)
+
+
+def immutable_cards():
+    """Add ImmutableCards to the server `streamlit run` starts in this process
+
+    Streamlit's static file serving sends no Cache-Control of its own. Returns
+    False if this Streamlit version builds its server differently.
+    """
+    try:
+        from starlette.middleware import Middleware
+        from streamlit.web.server.starlette import starlette_app
+        create_middleware = starlette_app.create_streamlit_middleware
+    except (ImportError, AttributeError):
+        return False
+    starlette_app.create_streamlit_middleware = lambda: [Middleware(ImmutableCards), *create_middleware()]
+    return True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the alphabet's picture cards into static/cards/")
+    parser.add_argument("--pictures", default=PICTURES_DIR, help="folder with a picture per word, named after the word")
+    args = parser.parse_args(argv)
+
+    cards = build_cards(pictures_dir=args.pictures)
+    files = set().union(*map(card_files, cards.values()))
+    size = sum(os.path.getsize(os.path.join(CARDS_DIR, name)) for name in files)
+    print(f"{len(cards)} cards, {len(files)} files, {size / 1024:.1f} KiB in static/cards/")
+
+
+if __name__ == "__main__":
+    main()
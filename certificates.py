@@ -0,0 +1,232 @@
+"""Downloadable PDF certificates, rendered off the script thread and cached on disk.
+
+A certificate is a one-page PDF written by hand (no PDF library needed): the
+child's name and total score on a template's colors, border and stars, in the
+standard Helvetica fonts every PDF reader has. Rendering happens in a small
+process pool, so when a whole school opens its certificates at the end of
+term the app's script threads only ever check for a file.
+
+Rendered files are kept under certificates/<key>.pdf, where the key hashes
+(name, score, template). A hit refreshes the file's mtime; once the directory
+grows past CERT_CACHE_BYTES the least recently used files are deleted. App
+processes on one machine share the directory.
+
+    BUBBLES_CERTIFICATES_DIR   where certificates go (default: certificates/ next to the app)
+    BUBBLES_CERT_WORKERS       processes rendering certificates (default: 2)
+"""
+import hashlib
+import json
+import math
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+CERTIFICATES_DIR = os.environ.get(
+    "BUBBLES_CERTIFICATES_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "certificates"),
+)
+# Certificates kept on disk across all processes
+CERT_CACHE_BYTES = 64 * 1024 * 1024
+WORKERS = int(os.environ.get("BUBBLES_CERT_WORKERS") or 2)
+
+# Colors as RGB in 0..1
+TEMPLATES = {
+    "classic": {
+        "background": (1.0, 0.98, 0.92),
+        "border": (0.306, 0.804, 0.769),
+        "title": (0.306, 0.804, 0.769),
+        "name": (1.0, 0.42, 0.42),
+        "text": (0.2, 0.2, 0.2),
+        "star": (1.0, 0.843, 0.0),
+    },
+}
+DEFAULT_TEMPLATE = "classic"
+
+# A4 landscape, in points
+PAGE_WIDTH = 842
+PAGE_HEIGHT = 595
+
+# Glyph widths (1/1000 em) of characters 32..126 in the standard fonts
+FONT_WIDTHS = {
+    "Helvetica": [
+        278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,
+        556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556,
+        1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778,
+        667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556,
+        333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,
+        556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584,
+    ],
+    "Helvetica-Bold": [
+        278, 333, 474, 556, 556, 889, 722, 238, 333, 333, 389, 584, 278, 333, 278, 278,
+        556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 333, 333, 584, 584, 584, 611,
+        975, 722, 722, 722, 722, 667, 611, 778, 722, 278, 556, 722, 611, 833, 722, 778,
+        667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 333, 278, 333, 584, 556,
+        333, 556, 611, 556, 611, 556, 333, 611, 611, 278, 278, 556, 278, 889, 611, 611,
+        611, 611, 389, 556, 333, 611, 556, 778, 556, 556, 500, 389, 280, 389, 584,
+    ],
+}
+# Fonts as named in the page's resources
+FONT_NAMES = {"Helvetica": "F1", "Helvetica-Bold": "F2"}
+
+
+def certificate_key(name, score, template=DEFAULT_TEMPLATE):
+    """File name stem for a certificate; changes whenever the template's colors do"""
+    data = json.dumps([name, score, template, TEMPLATES[template]])
+    return hashlib.sha1(data.encode()).hexdigest()[:20]
+
+
+def _encode(text):
+    """Text as the fonts' WinAnsi bytes; characters they lack become ?"""
+    return text.encode("cp1252", errors="replace")
+
+
+def _text_width(data, font, size):
+    widths = FONT_WIDTHS[font]
+    return sum(widths[b - 32] if 32 <= b <= 126 else 556 for b in data) * size / 1000
+
+
+def _centered_text(data, font, size, y, color, max_width=PAGE_WIDTH - 160):
+    """PDF operators drawing one line centered on the page, shrunk to fit max_width"""
+    width = _text_width(data, font, size)
+    if width > max_width:
+        size = size * max_width / width
+        width = max_width
+    escaped = data.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)")
+    x = (PAGE_WIDTH - width) / 2
+    return b"%.3f %.3f %.3f rg BT /%s %.1f Tf %.1f %.1f Td (" % (*color, FONT_NAMES[font].encode(), size, x, y) + escaped + b") Tj ET\n"
+
+
+def _star(cx, cy, radius, color):
+    """PDF operators filling a five-pointed star"""
+    points = []
+    for i in range(10):
+        r = radius if i % 2 == 0 else radius * 0.4
+        angle = math.pi / 2 + i * math.pi / 5
+        points.append((cx + r * math.cos(angle), cy + r * math.sin(angle)))
+    path = b"%.1f %.1f m " % points[0] + b"".join(b"%.1f %.1f l " % p for p in points[1:])
+    return b"%.3f %.3f %.3f rg " % color + path + b"h f\n"
+
+
+def render_certificate(name, score, template=DEFAULT_TEMPLATE):
+    """A one-page PDF certificate for `name` with `score` points"""
+    colors = TEMPLATES[template]
+    content = b"".join([
+        b"%.3f %.3f %.3f rg 0 0 %d %d re f\n" % (*colors["background"], PAGE_WIDTH, PAGE_HEIGHT),
+        b"%.3f %.3f %.3f RG 12 w 30 30 %d %d re S\n" % (*colors["border"], PAGE_WIDTH - 60, PAGE_HEIGHT - 60),
+        b"2 w 48 48 %d %d re S\n" % (PAGE_WIDTH - 96, PAGE_HEIGHT - 96),
+        _centered_text(b"Certificate of Achievement", "Helvetica-Bold", 44, 455, colors["title"]),
+        _centered_text(b"This certificate is awarded to", "Helvetica", 20, 395, colors["text"]),
+        _centered_text(_encode(name), "Helvetica-Bold", 48, 320, colors["name"]),
+        _centered_text(b"For excellent performance in learning!", "Helvetica", 20, 265, colors["text"]),
+        *(_star(PAGE_WIDTH / 2 + dx, 200, 26, colors["star"]) for dx in (-80, 0, 80)),
+        _centered_text(b"Total Score: %d" % score, "Helvetica-Bold", 28, 110, colors["text"]),
+    ])
+
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] /Contents 4 0 R"
+        b" /Resources << /Font << /F1 5 0 R /F2 6 0 R >> >> >>" % (PAGE_WIDTH, PAGE_HEIGHT),
+        b"<< /Length %d >>\nstream\n" % len(content) + content + b"endstream",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>",
+    ]
+    pdf = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(pdf))
+        pdf += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(pdf)
+    pdf += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    pdf += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    pdf += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(pdf)
+
+
+def _render_to_file(path, name, score, template):
+    """Render in a worker process and move the file into place whole"""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(render_certificate(name, score, template))
+    os.replace(tmp, path)
+    return path
+
+
+class CertificateCache:
+    """Certificates rendered in worker processes, kept on disk in a bytes-bounded LRU"""
+
+    def __init__(self, max_bytes=CERT_CACHE_BYTES, root=None, workers=WORKERS):
+        self.max_bytes = max_bytes
+        self.root = root or CERTIFICATES_DIR
+        self.workers = workers
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._pool = None
+
+    def _path(self, name, score, template):
+        return os.path.join(self.root, f"{certificate_key(name, score, template)}.pdf")
+
+    def get(self, name, score, template=DEFAULT_TEMPLATE):
+        """PDF bytes if the certificate is ready; otherwise queue it and return None"""
+        path = self._path(name, score, template)
+        try:
+            with open(path, "rb") as f:
+                pdf = f.read()
+            os.utime(path)
+            return pdf
+        except OSError:
+            pass
+        with self._lock:
+            if path in self._pending:
+                return None
+            if self._pool is None:
+                os.makedirs(self.root, exist_ok=True)
+                # Spawned workers only import this module, not the app
+                self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            try:
+                future = self._pool.submit(_render_to_file, path, name, score, template)
+            except BrokenProcessPool:
+                # A worker died (e.g. killed for memory); start a new pool on the next poll
+                self._pool = None
+                return None
+            self._pending[path] = future
+        # Outside the lock: a render that already finished runs the callback right here
+        future.add_done_callback(lambda _, path=path: self._rendered(path))
+        return None
+
+    def _rendered(self, path):
+        with self._lock:
+            self._pending.pop(path, None)
+        self.evict()
+
+    def evict(self):
+        """Delete least recently used certificates until the directory fits max_bytes"""
+        try:
+            entries = [entry for entry in os.scandir(self.root) if entry.name.endswith(".pdf")]
+        except OSError:
+            return
+        files = []
+        for entry in entries:
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        files.sort()
+        # The newest certificate always stays: it's the one a child is waiting for
+        for _, size, path in files[:-1]:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def pending(self):
+        """Number of certificates still being rendered"""
+        with self._lock:
+            return len(self._pending)
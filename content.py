@@ -0,0 +1,129 @@
+"""Content packs: the words, shapes and colors the games draw from.
+
+Each pack is a JSON file in content/:
+
+    letters-<language>.json   the alphabet in order, with example words per letter
+    shapes.json               shapes for the counting and shapes games, and counting questions
+    palettes.json             colors for round objects and for the alphabet's letters
+
+A pack is parsed and indexed once per file version and shared by every
+session in the process; a lookup costs one stat of the file, however big the
+vocabulary. Editing a file takes effect on the next rerun. If the edit
+doesn't parse, or names a shape or round color rounds.py has no board code
+for, it is logged and the last good version keeps being served.
+
+Add a language by adding its letters-<language>.json; ?lang=<language> in the
+URL picks it, falling back to English.
+"""
+import functools
+import json
+import os
+
+import streamlit as st
+from streamlit.logger import get_logger
+
+CONTENT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "content")
+DEFAULT_LANGUAGE = "en"
+
+# Last pack that parsed, per file, served while a broken edit is fixed
+_last_good = {}
+# File version of each pack's broken edit, so it is only logged once
+_broken = {}
+
+_LOGGER = get_logger(__name__)
+
+
+def _index_letters(data):
+    """Letters in order, each letter's position and its words"""
+    order = list(data["letters"])
+    return {
+        "language": data["language"],
+        "order": order,
+        "index": {letter: i for i, letter in enumerate(order)},
+        "words": data["letters"],
+    }
+
+
+def _check_names(names, known, what):
+    """Reject a pack naming anything boards have no code for"""
+    unknown = sorted(set(names) - set(known))
+    if unknown:
+        raise ValueError(f"no board code for {what}: {', '.join(unknown)}")
+
+
+def _index_shapes(data):
+    """Shape lists, checked against the board codes"""
+    # rounds imports this module, so its code tables are looked up late
+    from rounds import SHAPES
+    _check_names(data["counting"] + data["shapes"], SHAPES, "shapes")
+    return data
+
+
+def _index_palettes(data):
+    """Palettes, with the round colors checked against the board codes"""
+    from rounds import COLORS
+    # Other palettes are plain CSS colors
+    _check_names(data["rounds"], COLORS, "colors")
+    return data
+
+
+# How each kind of pack is checked and indexed after parsing; packs not listed are used as parsed
+INDEXERS = {
+    "letters": _index_letters,
+    "shapes": _index_shapes,
+    "palettes": _index_palettes,
+}
+
+
+@functools.lru_cache(maxsize=32)
+def _read_pack(path, mtime):
+    """Parse and index a pack file; cached per file version"""
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    kind = os.path.basename(path).split("-")[0].removesuffix(".json")
+    return INDEXERS.get(kind, lambda data: data)(data)
+
+
+def content_pack(name):
+    """The indexed pack content/<name>.json"""
+    path = os.path.join(CONTENT_DIR, f"{name}.json")
+    mtime = os.stat(path).st_mtime_ns
+    if _broken.get(path) == mtime:
+        return _last_good[path]
+    try:
+        pack = _read_pack(path, mtime)
+    except (ValueError, KeyError) as err:
+        if path not in _last_good:
+            raise
+        _broken[path] = mtime
+        _LOGGER.warning("Bad edit to %s, still serving the last good version: %s", path, err)
+        return _last_good[path]
+    _last_good[path] = pack
+    return pack
+
+
+def current_language():
+    """The language of the alphabet, from ?lang= in the URL"""
+    return st.query_params.get("lang", DEFAULT_LANGUAGE)
+
+
+def letter_pack(language=None):
+    """Letters and words for a language; English if there is no pack for it"""
+    language = language or current_language()
+    # Only plain language codes (en, es, pt-BR) name a file
+    if not language.replace("-", "").isalnum():
+        language = DEFAULT_LANGUAGE
+    try:
+        return content_pack(f"letters-{language}")
+    except FileNotFoundError:
+        return content_pack(f"letters-{DEFAULT_LANGUAGE}")
+
+
+def shape_sets():
+    """{"counting", "counting_questions", "shapes"} name lists"""
+    return content_pack("shapes")
+
+
+def palette(name):
+    """Color names of one palette in palettes.json"""
+    return content_pack("palettes")[name]
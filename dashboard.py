@@ -0,0 +1,106 @@
+"""Teacher dashboard: accuracy and progress per class and per child.
+
+Open the app with ?view=teacher. The page is built from the progress store's
+aggregate tables only (scores and answer totals per child and game, and the
+class roster), which are kept up to date as answers arrive, so loading it
+never reads the raw answer history.
+"""
+import streamlit as st
+
+from progress import progress_store
+
+# Games with right and wrong answers; alphabet only counts words shown
+ANSWERED_GAMES = ("counting", "shapes")
+GAMES = ("counting", "alphabet", "shapes")
+NO_CLASS = "No class"
+
+
+def teacher_view():
+    """Whether this page load is the teacher dashboard"""
+    return st.query_params.get("view") == "teacher"
+
+
+def _accuracy(answers, correct):
+    return round(100 * correct / answers) if answers else None
+
+
+def _totals(children):
+    """Summed (answers, correct, response_ms) per game over some children"""
+    totals = {game: [0, 0, 0] for game in GAMES}
+    for child in children:
+        for game, counts in child["answers"].items():
+            if game in totals:
+                for i, count in enumerate(counts):
+                    totals[game][i] += count
+    return totals
+
+
+def _average_seconds(totals):
+    answers = sum(totals[game][0] for game in ANSWERED_GAMES)
+    response_ms = sum(totals[game][2] for game in ANSWERED_GAMES)
+    return round(response_ms / answers / 1000, 1) if answers else None
+
+
+def class_rows(report):
+    """One row per class: size, points, accuracy per game and answer time"""
+    classes = {}
+    for child in report.values():
+        classes.setdefault(child["class"] or NO_CLASS, []).append(child)
+
+    rows = []
+    for name in sorted(classes):
+        children = classes[name]
+        totals = _totals(children)
+        row = {"class": name, "children": len(children)}
+        row["points"] = sum(sum(child["scores"].values()) for child in children)
+        for game in ANSWERED_GAMES:
+            row[f"{game} accuracy"] = _accuracy(*totals[game][:2])
+        row["words shown"] = totals["alphabet"][0]
+        row["answer time (s)"] = _average_seconds(totals)
+        rows.append(row)
+    return rows
+
+
+def child_rows(report, class_name):
+    """One row per child in a class: score and accuracy per game"""
+    rows = []
+    for name in sorted(report):
+        child = report[name]
+        if (child["class"] or NO_CLASS) != class_name:
+            continue
+        totals = _totals([child])
+        row = {"child": name}
+        for game in GAMES:
+            row[f"{game} score"] = child["scores"].get(game, 0)
+            if game in ANSWERED_GAMES:
+                row[f"{game} accuracy"] = _accuracy(*totals[game][:2])
+        row["answer time (s)"] = _average_seconds(totals)
+        rows.append(row)
+    return rows
+
+
+def _column_config(rows):
+    """Accuracy columns shown as percentages"""
+    return {
+        column: st.column_config.NumberColumn(format="%d%%")
+        for column in (rows[0] if rows else {})
+        if column.endswith("accuracy")
+    }
+
+
+def teacher_dashboard():
+    """Per-class overview, and the children of one class"""
+    st.markdown('<h1 class="main-header">Teacher Dashboard</h1>', unsafe_allow_html=True)
+    report = progress_store().school_report()
+    if not report:
+        st.info("No progress yet. Children's scores show up here once they start playing.")
+        return
+
+    classes = class_rows(report)
+    st.subheader("Classes")
+    st.dataframe(classes, hide_index=True, width="stretch", column_config=_column_config(classes))
+
+    class_name = st.selectbox("Class", [row["class"] for row in classes], key="dashboard_class")
+    children = child_rows(report, class_name)
+    st.subheader(f"Children in {class_name}")
+    st.dataframe(children, hide_index=True, width="stretch", column_config=_column_config(children))
@@ -0,0 +1,363 @@
+"""Bidirectional drawing canvas for the drawing game.
+
+The canvas is an st.components.v2 component that stays mounted across
+reruns. The browser batches pointer points into strokes, redraws once per
+animation frame, and after a short pause sends only the strokes finished
+since the last sync. Strokes are kept compact: a palette index, a brush size
+and a flat list of integer points, delta-encoded after the first point:
+
+    {"c": 1, "s": 5, "p": [x0, y0, dx1, dy1, dx2, dy2, ...]}
+
+When the canvas is mounted fresh (e.g. coming back from the menu) it restores
+from a bitmap snapshot kept in the browser's sessionStorage, and only falls
+back to replaying the strokes held in Python when the snapshot is stale.
+Encoding the snapshot is a full-canvas PNG, so it is taken lazily: when the
+canvas unmounts or the page is hidden, and at most every SNAPSHOT_INTERVAL_MS
+otherwise. Snapshots are keyed per session and child, so two sessions in one
+tab never restore each other's drawing.
+"""
+import streamlit as st
+
+PALETTE = ['black', 'red', 'green', 'blue', 'yellow', 'purple', 'orange', 'pink', 'brown', 'white']
+BRUSH_SIZES = [2, 5, 10, 15, 20]
+WIDTH = 800
+HEIGHT = 400
+
+# Milliseconds of quiet after a stroke before the batch is sent to Python
+SYNC_DEBOUNCE_MS = 400
+# Least milliseconds between bitmap snapshots while the canvas stays on screen
+SNAPSHOT_INTERVAL_MS = 10000
+
+CANVAS_HTML = f"""
+<div class="canvas-container">
+    <canvas width="{WIDTH}" height="{HEIGHT}"></canvas>
+</div>
+<div class="color-palette">
+    {''.join(f'<div class="color-btn" style="background-color:{color};" data-color="{i}"></div>' for i, color in enumerate(PALETTE))}
+</div>
+<div class="brush-size-container">
+    {''.join(f'<div class="brush-btn" data-size="{size}"><div style="width:{size}px;height:{size}px;"></div></div>' for size in BRUSH_SIZES)}
+</div>
+<div class="clear-container">
+    <button class="btn-primary" data-action="clear">Clear Canvas</button>
+</div>
+"""
+
+CANVAS_CSS = """
+.canvas-container {
+    display: flex;
+    justify-content: center;
+    margin: 20px 0;
+}
+canvas {
+    border: 2px solid #ddd;
+    border-radius: 10px;
+    background: white;
+    max-width: 100%;
+    touch-action: none;
+}
+.color-palette, .brush-size-container {
+    display: flex;
+    justify-content: center;
+    flex-wrap: wrap;
+    margin: 10px 0;
+}
+.color-btn, .brush-btn {
+    width: 40px;
+    height: 40px;
+    border-radius: 50%;
+    margin: 5px;
+    border: 2px solid #ddd;
+    cursor: pointer;
+}
+.brush-btn {
+    display: flex;
+    justify-content: center;
+    align-items: center;
+}
+.brush-btn div {
+    background-color: black;
+    border-radius: 50%;
+}
+.selected {
+    border-color: #4ECDC4;
+}
+.clear-container {
+    text-align: center;
+    margin-top: 20px;
+}
+.btn-primary {
+    background-color: #FF9F1C;
+    color: white;
+    border: none;
+    padding: 10px 20px;
+    border-radius: 25px;
+    font-size: 1.2rem;
+    cursor: pointer;
+}
+"""
+
+CANVAS_JS = """
+function setup(root, palette, debounceMs, snapshotKey, snapshotMs) {
+    const canvas = root.querySelector('canvas');
+    const ctx = canvas.getContext('2d');
+    ctx.lineCap = 'round';
+    ctx.lineJoin = 'round';
+
+    const state = {
+        color: 0,
+        size: 5,
+        synced: 0,      // strokes Python already has
+        strokes: [],    // all strokes on this canvas, compact form
+        current: null,  // stroke being drawn: {c, s, p}, absolute points
+        pending: [],    // points drawn since the last animation frame
+        frame: 0,
+        timer: 0,
+        send: null,     // latest setTriggerValue, refreshed on every render
+        dirty: false,   // strokes drawn since the last snapshot
+        snapshotAt: 0,
+    };
+
+    function point(e) {
+        const rect = canvas.getBoundingClientRect();
+        return [
+            Math.round((e.clientX - rect.left) * canvas.width / rect.width),
+            Math.round((e.clientY - rect.top) * canvas.height / rect.height),
+        ];
+    }
+
+    // Draw everything queued since the last frame as one path
+    function flushFrame() {
+        state.frame = 0;
+        const stroke = state.current;
+        if (!stroke || state.pending.length < 2) return;
+        ctx.strokeStyle = palette[stroke.c];
+        ctx.lineWidth = stroke.s;
+        ctx.beginPath();
+        ctx.moveTo(state.pending[0], state.pending[1]);
+        for (let i = 2; i < state.pending.length; i += 2) {
+            ctx.lineTo(state.pending[i], state.pending[i + 1]);
+        }
+        ctx.stroke();
+        // Keep the last point so the next frame continues the line
+        state.pending = state.pending.slice(-2);
+    }
+
+    function queuePoint(x, y) {
+        state.current.p.push(x, y);
+        state.pending.push(x, y);
+        if (!state.frame) state.frame = requestAnimationFrame(flushFrame);
+    }
+
+    function encode(stroke) {
+        const p = stroke.p;
+        const out = [p[0], p[1]];
+        for (let i = 2; i < p.length; i += 2) {
+            out.push(p[i] - p[i - 2], p[i + 1] - p[i - 1]);
+        }
+        return { c: stroke.c, s: stroke.s, p: out };
+    }
+
+    function sync() {
+        state.timer = 0;
+        const batch = state.strokes.slice(state.synced);
+        if (!batch.length) return;
+        state.send('strokes', { base: state.synced, strokes: batch });
+        state.synced = state.strokes.length;
+        state.dirty = true;
+        snapshot(false);
+    }
+
+    // Keep a bitmap of the synced strokes for the next mount; a PNG encode,
+    // so only when it's worth it
+    function snapshot(force) {
+        if (!state.dirty || (!force && performance.now() - state.snapshotAt < snapshotMs)) return;
+        state.dirty = false;
+        state.snapshotAt = performance.now();
+        try {
+            sessionStorage.setItem(snapshotKey, JSON.stringify({
+                count: state.synced,
+                image: canvas.toDataURL(),
+            }));
+        } catch (err) {
+            // Storage full or disabled; replaying from Python still works
+        }
+    }
+    state.snapshot = snapshot;
+    const onHidden = () => { if (document.visibilityState === 'hidden') snapshot(true); };
+    const onPageHide = () => snapshot(true);
+    document.addEventListener('visibilitychange', onHidden);
+    window.addEventListener('pagehide', onPageHide);
+    state.detach = () => {
+        document.removeEventListener('visibilitychange', onHidden);
+        window.removeEventListener('pagehide', onPageHide);
+    };
+
+    canvas.addEventListener('pointerdown', (e) => {
+        canvas.setPointerCapture(e.pointerId);
+        const [x, y] = point(e);
+        state.current = { c: state.color, s: state.size, p: [] };
+        state.pending = [];
+        queuePoint(x, y);
+        queuePoint(x, y);
+    });
+
+    canvas.addEventListener('pointermove', (e) => {
+        if (!state.current) return;
+        const [x, y] = point(e);
+        const p = state.current.p;
+        if (x === p[p.length - 2] && y === p[p.length - 1]) return;
+        queuePoint(x, y);
+    });
+
+    function endStroke() {
+        if (!state.current) return;
+        if (state.frame) {
+            cancelAnimationFrame(state.frame);
+            flushFrame();
+        }
+        state.strokes.push(encode(state.current));
+        state.current = null;
+        clearTimeout(state.timer);
+        state.timer = setTimeout(sync, debounceMs);
+    }
+    canvas.addEventListener('pointerup', endStroke);
+    canvas.addEventListener('pointercancel', endStroke);
+
+    function picker(selector, pick) {
+        const buttons = root.querySelectorAll(selector);
+        buttons.forEach((btn) => {
+            btn.addEventListener('click', () => {
+                buttons.forEach((other) => other.classList.toggle('selected', other === btn));
+                pick(btn);
+            });
+        });
+    }
+    picker('[data-color]', (btn) => { state.color = Number(btn.dataset.color); });
+    picker('[data-size]', (btn) => { state.size = Number(btn.dataset.size); });
+    root.querySelector('[data-action="clear"]').addEventListener('click', () => {
+        clearTimeout(state.timer);
+        ctx.clearRect(0, 0, canvas.width, canvas.height);
+        state.strokes = [];
+        state.synced = 0;
+        state.dirty = false;
+        sessionStorage.removeItem(snapshotKey);
+        state.send('cleared', true);
+    });
+
+    function replay(strokes) {
+        for (const stroke of strokes) {
+            const p = stroke.p;
+            ctx.strokeStyle = palette[stroke.c];
+            ctx.lineWidth = stroke.s;
+            ctx.beginPath();
+            let x = p[0], y = p[1];
+            ctx.moveTo(x, y);
+            ctx.lineTo(x, y);
+            for (let i = 2; i < p.length; i += 2) {
+                x += p[i];
+                y += p[i + 1];
+                ctx.lineTo(x, y);
+            }
+            ctx.stroke();
+        }
+    }
+
+    // Bring a freshly mounted canvas back to what Python has
+    state.restore = (restore) => {
+        if (!restore || !restore.strokes.length) return;
+        state.strokes = restore.strokes.slice();
+        state.synced = state.strokes.length;
+        let saved = null;
+        try {
+            saved = JSON.parse(sessionStorage.getItem(snapshotKey));
+        } catch (err) {
+            saved = null;
+        }
+        if (saved && saved.count === state.strokes.length) {
+            const image = new Image();
+            image.onload = () => ctx.drawImage(image, 0, 0);
+            image.src = saved.image;
+        } else {
+            replay(state.strokes);
+        }
+    };
+    state.sync = sync;
+
+    return state;
+}
+
+export default function(component) {
+    const { data, setTriggerValue, parentElement } = component;
+    // Reruns call this again with new data; the canvas itself is set up once
+    if (!parentElement.__drawing) {
+        parentElement.__drawing = setup(parentElement, data.palette, data.debounce_ms, data.snapshot_key, data.snapshot_ms);
+        parentElement.__drawing.restore(data.restore);
+        parentElement.__drawing.resynced = data.resync;
+    }
+    const state = parentElement.__drawing;
+    state.send = setTriggerValue;
+    // Python missed a batch: send every stroke again from the start
+    if (data.resync > state.resynced) {
+        state.resynced = data.resync;
+        state.synced = 0;
+        clearTimeout(state.timer);
+        state.sync();
+    }
+    // Unmounting (e.g. back to the menu): keep the bitmap for the next mount
+    return () => {
+        state.snapshot(true);
+        state.detach();
+        delete parentElement.__drawing;
+    };
+}
+"""
+
+_canvas_component = st.components.v2.component(
+    "drawing_canvas",
+    html=CANVAS_HTML,
+    css=CANVAS_CSS,
+    js=CANVAS_JS,
+)
+
+
+def drawing_canvas(strokes, restore=False, resync=0, snapshot_key="", key=None):
+    """Mount the canvas and return (new strokes, cleared) from this run
+
+    `strokes` is what Python already holds. They are only sent down when
+    `restore` is set, i.e. on the first render after the canvas was away.
+    New strokes come back as {"base": n, "strokes": [...]}, where `base` is
+    how many strokes the browser believed Python had. Raising `resync` asks
+    the mounted canvas to send all of its strokes again from base 0.
+    `snapshot_key` names whose drawing this is, so the browser's bitmap
+    snapshot is never restored into another session or child.
+    """
+    data = {
+        "palette": PALETTE,
+        "debounce_ms": SYNC_DEBOUNCE_MS,
+        "restore": {"strokes": strokes} if restore else None,
+        "resync": resync,
+        "snapshot_key": f"bubbles-drawing:{snapshot_key}",
+        "snapshot_ms": SNAPSHOT_INTERVAL_MS,
+    }
+    result = _canvas_component(
+        key=key,
+        data=data,
+        on_strokes_change=lambda: None,
+        on_cleared_change=lambda: None,
+    )
+    return result.strokes, bool(result.cleared)
+
+
+def apply_stroke_delta(strokes, delta):
+    """Merge a batch of strokes sent by the canvas into `strokes` in place
+
+    Returns False, leaving `strokes` alone, if an earlier batch never
+    arrived; the canvas then has to resync.
+    """
+    base = delta["base"]
+    if base > len(strokes):
+        return False
+    # The browser's base wins: anything past it was cleared or resent
+    strokes[base:] = delta["strokes"]
+    return True
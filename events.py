@@ -0,0 +1,335 @@
+"""Answer events, recorded off the click path and rolled up in the background.
+
+Every answer in the counting and shapes games, and every Show Word in the
+alphabet game, is an event: (time, child, game, correct, target, response ms).
+`record()` only appends to an in-memory queue. A background thread drains the
+queue every FLUSH_INTERVAL seconds into append-only segment files, one JSON
+array per line:
+
+    events/segment-<start time ns>-<pid>.open    being written by process <pid>
+    events/segment-<start time ns>-<pid>.jsonl   closed
+
+Every COMPACT_INTERVAL seconds each process closes its segment, and closed
+segments are rolled up into one file per day (UTC) and deleted. So are open
+segments whose process is gone, e.g. after a crash:
+
+    events/rollup-<YYYY-MM-DD>.bin
+
+A rollup holds answers, correct answers and total response time per (child,
+game, target), as columns of typed arrays. So raw history only ever covers
+the events since the last compaction.
+
+Each written batch is also added to the per-(child, game) answer totals in
+the progress store, which is what the teacher dashboard reads.
+
+    BUBBLES_EVENTS_DIR   where segments and rollups go (default: events/ next to the app)
+"""
+import atexit
+import glob
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+from array import array
+from collections import deque
+
+import streamlit as st
+
+from progress import current_child, progress_store
+
+EVENTS_DIR = os.environ.get(
+    "BUBBLES_EVENTS_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "events"),
+)
+MAGIC = b"BER1"
+# Seconds between background writes, and between compactions
+FLUSH_INTERVAL = 1.0
+COMPACT_INTERVAL = 300.0
+# A segment is closed once it grows past this many bytes
+SEGMENT_BYTES = 8 * 1024 * 1024
+# Events held in memory if the disk falls behind; the oldest are dropped first
+MAX_QUEUED = 1_000_000
+# A compaction lock older than this was left by a process that died
+STALE_LOCK_SECONDS = 600
+
+# Rollup columns: (name, array typecode)
+COLUMNS = (
+    ("child", "I"), ("game", "B"), ("target", "H"),
+    ("answers", "I"), ("correct", "I"), ("response_ms", "Q"),
+)
+
+
+def encode_rollup(rows):
+    """Pack {(child, game, target): [answers, correct, response_ms]} into bytes"""
+    names = {"child": {}, "game": {}, "target": {}}
+    columns = {name: array(typecode) for name, typecode in COLUMNS}
+    for key, totals in rows.items():
+        for name, value in zip(("child", "game", "target"), key):
+            columns[name].append(names[name].setdefault(value, len(names[name])))
+        for name, value in zip(("answers", "correct", "response_ms"), totals):
+            columns[name].append(value)
+    header = json.dumps({name: list(values) for name, values in names.items()}).encode()
+    body = b"".join(columns[name].tobytes() for name, _ in COLUMNS)
+    return MAGIC + struct.pack("<II", len(rows), len(header)) + header + zlib.compress(body, 6)
+
+
+def decode_rollup(data):
+    """Unpack bytes written by encode_rollup"""
+    if data[:4] != MAGIC:
+        raise ValueError("Not a rollup file")
+    n, header_size = struct.unpack("<II", data[4:12])
+    names = json.loads(data[12:12 + header_size])
+    body = zlib.decompress(data[12 + header_size:])
+
+    columns = {}
+    offset = 0
+    for name, typecode in COLUMNS:
+        column = array(typecode)
+        column.frombytes(body[offset:offset + n * column.itemsize])
+        offset += n * column.itemsize
+        columns[name] = column
+
+    rows = {}
+    for i in range(n):
+        key = (names["child"][columns["child"][i]], names["game"][columns["game"][i]], names["target"][columns["target"][i]])
+        rows[key] = [columns["answers"][i], columns["correct"][i], columns["response_ms"][i]]
+    return rows
+
+
+def load_rollup(path):
+    with open(path, "rb") as f:
+        return decode_rollup(f.read())
+
+
+def rollup_paths(directory=None):
+    """Every day's rollup file, oldest first"""
+    return sorted(glob.glob(os.path.join(directory or EVENTS_DIR, "rollup-*.bin")))
+
+
+def segment_paths(directory=None):
+    """Closed segments not compacted yet, oldest first"""
+    return sorted(glob.glob(os.path.join(directory or EVENTS_DIR, "segment-*.jsonl")))
+
+
+def _writer_alive(path):
+    """Whether the process that opened a segment may still be writing it"""
+    pid = int(os.path.basename(path).split(".")[0].rsplit("-", 1)[1])
+    if pid == os.getpid():
+        return True
+    if os.name == "nt":
+        # os.kill can't probe a process on Windows; an open segment is closed
+        # at least every COMPACT_INTERVAL, so one untouched for longer is orphaned
+        return time.time() - os.path.getmtime(path) < 2 * COMPACT_INTERVAL
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+
+def orphaned_segments(directory=None):
+    """Open segments left behind by a process that is no longer running"""
+    paths = glob.glob(os.path.join(directory or EVENTS_DIR, "segment-*.open"))
+    return sorted(path for path in paths if not _writer_alive(path))
+
+
+def read_segment(path):
+    """Events in a segment; a line cut short by a crash is skipped"""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                yield tuple(json.loads(line))
+            except ValueError:
+                continue
+
+
+def add_event(rows, event):
+    """Count one event into {(child, game, target): [answers, correct, response_ms]}"""
+    _, child, game, correct, target, response_ms = event
+    totals = rows.get((child, game, target))
+    if totals is None:
+        totals = rows[(child, game, target)] = [0, 0, 0]
+    totals[0] += 1
+    totals[1] += correct
+    totals[2] += response_ms
+
+
+def game_totals(rows):
+    """Collapse rows to {(child, game): [answers, correct, response_ms]}"""
+    totals = {}
+    for (child, game, _), counts in rows.items():
+        merge_rows(totals, {(child, game): counts})
+    return totals
+
+
+def history_rows(directory=None):
+    """Rollup rows for every event written so far, rollups and closed segments together"""
+    rows = {}
+    for path in rollup_paths(directory):
+        merge_rows(rows, load_rollup(path))
+    for path in segment_paths(directory):
+        for event in read_segment(path):
+            add_event(rows, event)
+    return rows
+
+
+def merge_rows(rows, other):
+    """Add one set of rollup rows into another"""
+    for key, (answers, correct, response_ms) in other.items():
+        totals = rows.get(key)
+        if totals is None:
+            rows[key] = [answers, correct, response_ms]
+        else:
+            totals[0] += answers
+            totals[1] += correct
+            totals[2] += response_ms
+
+
+class EventLog:
+    """Queue of answer events, written to segments and rolled up in the background"""
+
+    def __init__(self, directory=None, flush_interval=FLUSH_INTERVAL, compact_interval=COMPACT_INTERVAL, on_batch=None):
+        """`on_batch(totals)` is called on the writer thread with the
+        {(child, game): [answers, correct, response_ms]} of every batch written"""
+        self.directory = directory or EVENTS_DIR
+        self.on_batch = on_batch
+        self.flush_interval = flush_interval
+        self.compact_interval = compact_interval
+        # deque appends and pops are atomic, so record() takes no lock
+        self._queue = deque(maxlen=MAX_QUEUED)
+        # Guards the segment files, so flush() and compact() can be called from any thread
+        self._files = threading.Lock()
+        self._segment = None
+        self._segment_path = None
+        self._last_compact = time.monotonic()
+        self._wake = threading.Event()
+        self._closed = False
+        self._writer = threading.Thread(target=self._run, name="bubbles-events", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    def record(self, child, game, correct, target, response_ms, at=None):
+        """Queue an event; returns without touching disk"""
+        self._queue.append((at or time.time(), child, game, int(bool(correct)), str(target), int(response_ms)))
+
+    def flush(self):
+        """Append everything queued to the open segment; returns the number of events written"""
+        with self._files:
+            batch = []
+            while self._queue:
+                batch.append(self._queue.popleft())
+            if not batch:
+                return 0
+            if self._segment is None:
+                os.makedirs(self.directory, exist_ok=True)
+                self._segment_path = os.path.join(self.directory, f"segment-{time.time_ns()}-{os.getpid()}")
+                self._segment = open(self._segment_path + ".open", "a", encoding="utf-8")
+            self._segment.write("".join(json.dumps(event, separators=(",", ":")) + "\n" for event in batch))
+            self._segment.flush()
+            if self._segment.tell() >= SEGMENT_BYTES:
+                self._close_segment()
+        if self.on_batch:
+            rows = {}
+            for event in batch:
+                add_event(rows, event)
+            self.on_batch(game_totals(rows))
+        return len(batch)
+
+    def _close_segment(self):
+        """Close the open segment, which makes it ready for compaction"""
+        if self._segment is not None:
+            self._segment.close()
+            os.replace(self._segment_path + ".open", self._segment_path + ".jsonl")
+            self._segment = None
+
+    def compact(self):
+        """Roll every closed segment into its day's rollup and delete it; returns events rolled up"""
+        with self._files:
+            self._close_segment()
+        if not os.path.isdir(self.directory):
+            return 0
+        lock = os.path.join(self.directory, ".compact.lock")
+        try:
+            if time.time() - os.path.getmtime(lock) > STALE_LOCK_SECONDS:
+                os.remove(lock)
+        except OSError:
+            pass
+        # Processes sharing the directory take turns; whoever holds the lock compacts for all
+        try:
+            os.close(os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except OSError:
+            return 0
+        try:
+            # A crashed writer's segment is as closed as it will ever get
+            for path in orphaned_segments(self.directory):
+                os.replace(path, path[:-len(".open")] + ".jsonl")
+            days = {}
+            segments = segment_paths(self.directory)
+            count = 0
+            for path in segments:
+                for event in read_segment(path):
+                    add_event(days.setdefault(int(event[0] // 86400), {}), event)
+                    count += 1
+            for day, rows in days.items():
+                path = os.path.join(self.directory, f"rollup-{time.strftime('%Y-%m-%d', time.gmtime(day * 86400))}.bin")
+                if os.path.exists(path):
+                    merge_rows(rows, load_rollup(path))
+                with open(path + ".tmp", "wb") as f:
+                    f.write(encode_rollup(rows))
+                os.replace(path + ".tmp", path)
+            for path in segments:
+                os.remove(path)
+            return count
+        finally:
+            os.remove(lock)
+
+    def _run(self):
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+            if time.monotonic() - self._last_compact >= self.compact_interval:
+                self._last_compact = time.monotonic()
+                self.compact()
+
+    def close(self):
+        """Write what's left and stop the writer; compaction waits for the next start"""
+        if self._closed:
+            return
+        self._closed = True
+        self._wake.set()
+        self._writer.join()
+        self.flush()
+        with self._files:
+            self._close_segment()
+
+
+@st.cache_resource
+def event_log():
+    """The event log shared by every session in this process, feeding the answer totals"""
+    store = progress_store()
+    # Answers recorded before the totals existed are counted once, from the history
+    store.backfill_answers(lambda: game_totals(history_rows()))
+    return EventLog(on_batch=store.add_answers)
+
+
+def start_answer_clock(game):
+    """Start timing the child's next answer in `game`, e.g. when a round is shown"""
+    st.session_state[f"{game}_asked_at"] = time.time()
+
+
+def record_answer(game, correct, target, response_ms=None):
+    """Record an answer by the current child, timed from the question or their last answer
+
+    Answers checked in the browser pass the `response_ms` it measured.
+    """
+    now = time.time()
+    if response_ms is None:
+        asked = st.session_state.get(f"{game}_asked_at") or now
+        st.session_state[f"{game}_asked_at"] = now
+        response_ms = (now - asked) * 1000
+    event_log().record(current_child(), game, correct, target, response_ms, now)
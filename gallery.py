@@ -0,0 +1,214 @@
+"""Compact stroke storage and a per-child drawing gallery.
+
+Drawings are stored one file per drawing under gallery/<slug>-<hash>/, in a
+small array-backed format: per-stroke palette indexes, brush sizes and point
+counts, then every point as delta-encoded int16 pairs, all zlib-compressed.
+The slug keeps the directory readable and the short hash of the raw name
+keeps two names that slug alike ("Ana B" and "ana-b") from sharing a gallery.
+Each gallery also keeps an append-only index.jsonl with one line per drawing,
+so listing a gallery reads that one file and never decodes a stroke file.
+
+Thumbnails are rasterized lazily on a background worker thread and kept in a
+size-bounded LRU cache. They are never written to disk, so a gallery's
+stored bytes are its stroke files and its index.
+"""
+import hashlib
+import json
+import os
+import re
+import struct
+import threading
+import time
+import uuid
+import zlib
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from drawing_canvas import HEIGHT, PALETTE, WIDTH
+
+GALLERY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gallery")
+MAGIC = b"BDS1"
+
+THUMB_WIDTH = 160
+THUMB_HEIGHT = 80
+# Thumbnails kept in memory across all sessions of this process
+THUMB_CACHE_BYTES = 8 * 1024 * 1024
+
+# RGB for each palette entry, used when rasterizing thumbnails
+PALETTE_RGB = {
+    'black': (0, 0, 0), 'red': (255, 0, 0), 'green': (0, 128, 0), 'blue': (0, 0, 255),
+    'yellow': (255, 255, 0), 'purple': (128, 0, 128), 'orange': (255, 165, 0),
+    'pink': (255, 192, 203), 'brown': (165, 42, 42), 'white': (255, 255, 255),
+}
+
+
+def encode_strokes(strokes):
+    """Pack canvas strokes ({"c", "s", "p"} with delta points) into bytes"""
+    colors = array('B', (stroke["c"] for stroke in strokes))
+    sizes = array('B', (stroke["s"] for stroke in strokes))
+    counts = array('I', (len(stroke["p"]) // 2 for stroke in strokes))
+    points = array('h')
+    for stroke in strokes:
+        points.extend(stroke["p"])
+    body = b"".join(a.tobytes() for a in (colors, sizes, counts, points))
+    return MAGIC + struct.pack("<I", len(strokes)) + zlib.compress(body, 9)
+
+
+def decode_strokes(data):
+    """Unpack bytes written by encode_strokes back into canvas strokes"""
+    if data[:4] != MAGIC:
+        raise ValueError("Not a stroke file")
+    (n,) = struct.unpack("<I", data[4:8])
+    body = zlib.decompress(data[8:])
+
+    colors = array('B', body[:n])
+    sizes = array('B', body[n:2 * n])
+    counts = array('I')
+    counts.frombytes(body[2 * n:2 * n + 4 * n])
+    points = array('h')
+    points.frombytes(body[6 * n:])
+
+    strokes = []
+    offset = 0
+    for c, s, count in zip(colors, sizes, counts):
+        strokes.append({"c": c, "s": s, "p": points[offset:offset + 2 * count].tolist()})
+        offset += 2 * count
+    return strokes
+
+
+def _child_dir(child, root=GALLERY_DIR):
+    """Directory holding one child's drawings"""
+    slug = re.sub(r"[^a-z0-9_-]+", "-", child.lower()).strip("-") or "guest"
+    digest = hashlib.sha1(child.encode("utf-8")).hexdigest()[:8]
+    return os.path.join(root, f"{slug}-{digest}")
+
+
+def save_drawing(child, strokes, root=GALLERY_DIR):
+    """Store a drawing in the child's gallery and return its index entry"""
+    folder = _child_dir(child, root)
+    os.makedirs(folder, exist_ok=True)
+    drawing_id = uuid.uuid4().hex[:12]
+    data = encode_strokes(strokes)
+    with open(os.path.join(folder, f"{drawing_id}.strokes"), "wb") as f:
+        f.write(data)
+
+    entry = {"id": drawing_id, "created": time.time(), "strokes": len(strokes), "bytes": len(data)}
+    with open(os.path.join(folder, "index.jsonl"), "a", encoding="utf-8") as f:
+        f.write(json.dumps(entry) + "\n")
+    return entry
+
+
+def list_drawings(child, root=GALLERY_DIR):
+    """Index entries for a child's drawings, newest first"""
+    path = os.path.join(_child_dir(child, root), "index.jsonl")
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+    entries.reverse()
+    return entries
+
+
+def stored_bytes(child, root=GALLERY_DIR):
+    """Bytes a child's gallery takes on disk: each stroke file once, plus the index"""
+    path = os.path.join(_child_dir(child, root), "index.jsonl")
+    if not os.path.exists(path):
+        return 0
+    return sum(entry["bytes"] for entry in list_drawings(child, root)) + os.path.getsize(path)
+
+
+def load_drawing(child, drawing_id, root=GALLERY_DIR):
+    """Decode one drawing's strokes"""
+    with open(os.path.join(_child_dir(child, root), f"{drawing_id}.strokes"), "rb") as f:
+        return decode_strokes(f.read())
+
+
+def _png(width, height, rgb):
+    """Encode raw RGB rows as a PNG"""
+    def chunk(kind, payload):
+        return struct.pack(">I", len(payload)) + kind + payload + struct.pack(">I", zlib.crc32(kind + payload))
+
+    stride = width * 3
+    raw = b"".join(b"\x00" + bytes(rgb[y * stride:(y + 1) * stride]) for y in range(height))
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(raw, 6)) + chunk(b"IEND", b"")
+
+
+def rasterize_thumbnail(strokes, width=THUMB_WIDTH, height=THUMB_HEIGHT):
+    """Draw strokes scaled down onto a white canvas and return PNG bytes"""
+    pixels = bytearray(b"\xff" * (width * height * 3))
+    scale_x = width / WIDTH
+    scale_y = height / HEIGHT
+
+    def plot(x, y, color, radius):
+        for py in range(max(0, y - radius), min(height, y + radius + 1)):
+            for px in range(max(0, x - radius), min(width, x + radius + 1)):
+                i = (py * width + px) * 3
+                pixels[i:i + 3] = color
+
+    for stroke in strokes:
+        color = bytes(PALETTE_RGB[PALETTE[stroke["c"]]])
+        radius = max(0, round(stroke["s"] * scale_x / 2))
+        p = stroke["p"]
+        x, y = p[0], p[1]
+        last = (round(x * scale_x), round(y * scale_y))
+        plot(*last, color, radius)
+        for i in range(2, len(p), 2):
+            x += p[i]
+            y += p[i + 1]
+            nx, ny = round(x * scale_x), round(y * scale_y)
+            # Step along the scaled segment one pixel at a time
+            steps = max(abs(nx - last[0]), abs(ny - last[1]))
+            for step in range(1, steps + 1):
+                plot(last[0] + (nx - last[0]) * step // steps, last[1] + (ny - last[1]) * step // steps, color, radius)
+            last = (nx, ny)
+    return _png(width, height, pixels)
+
+
+class ThumbnailCache:
+    """Thumbnails rendered on a background worker, kept in a bytes-bounded LRU"""
+
+    def __init__(self, max_bytes=THUMB_CACHE_BYTES, root=GALLERY_DIR):
+        self.max_bytes = max_bytes
+        self.root = root
+        self._images = OrderedDict()
+        self._pending = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix="bubbles-thumbs")
+
+    def get(self, child, drawing_id):
+        """PNG bytes if the thumbnail is ready; otherwise queue it and return None"""
+        key = (child, drawing_id)
+        with self._lock:
+            if key in self._images:
+                self._images.move_to_end(key)
+                return self._images[key]
+            if key not in self._pending:
+                self._pending[key] = self._worker.submit(self._render, key)
+        return None
+
+    def _render(self, key):
+        png = None
+        try:
+            png = rasterize_thumbnail(load_drawing(*key, root=self.root))
+        except Exception:
+            # Missing or corrupt stroke file: a blank thumbnail, not a retry on every poll
+            png = rasterize_thumbnail([])
+        finally:
+            # Never left pending, or the gallery would keep polling for it
+            with self._lock:
+                self._pending.pop(key, None)
+                if png is not None:
+                    self._images[key] = png
+                    self._bytes += len(png)
+                    while self._bytes > self.max_bytes and len(self._images) > 1:
+                        _, evicted = self._images.popitem(last=False)
+                        self._bytes -= len(evicted)
+        return png
+
+    def pending(self):
+        """Number of thumbnails still being rendered"""
+        with self._lock:
+            return len(self._pending)
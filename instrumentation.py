@@ -0,0 +1,272 @@
+"""Opt-in per-rerun profiling for bubble.py.
+
+Set BUBBLES_METRICS=1 to turn it on. Every script run then records the time
+spent in each instrumented function, how many st.markdown/st.button/
+st.columns calls it made, the HTML payload it emitted and the size of the
+session state. Records are appended to a JSONL file (BUBBLES_METRICS_LOG,
+default metrics.jsonl) and rolled up into counters served as plain text at
+http://127.0.0.1:<BUBBLES_METRICS_PORT>/metrics (default 9464, 0 disables).
+Other modules can add gauges to the endpoint with register_gauge().
+
+When the variable is not set every helper here is a no-op and `instrumented`
+returns the function unchanged.
+"""
+import functools
+import json
+import os
+import pickle
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import streamlit as st
+import streamlit.components.v1
+
+ENABLED = os.environ.get("BUBBLES_METRICS", "") not in ("", "0")
+LOG_PATH = os.environ.get("BUBBLES_METRICS_LOG", "metrics.jsonl")
+PORT = int(os.environ.get("BUBBLES_METRICS_PORT", "9464"))
+
+# Streamlit calls that are counted, and which argument carries their payload
+COUNTED_CALLS = {
+    (st, "markdown"): 0,
+    (st, "button"): 0,
+    (st, "columns"): None,
+    (streamlit.components.v1, "html"): 0,
+}
+
+# st.rerun() and st.stop() end a script run by raising these
+_OUTCOMES = {"RerunException": "rerun", "StopException": "stop"}
+
+_local = threading.local()
+_lock = threading.Lock()
+_log_file = None
+_server = None
+_totals = {
+    "reruns": {},
+    "rerun_seconds": {},
+    "function_seconds": {},
+    "function_calls": {},
+    "st_calls": {},
+    "payload_bytes": 0,
+    "session_state_bytes_sum": 0,
+    "session_state_bytes_max": 0,
+}
+# Gauge name -> (help text, function returning [(labels, value)])
+_gauges = {}
+
+
+def _current_record():
+    """Return the record of the rerun running on this thread, if any"""
+    return getattr(_local, "record", None)
+
+
+def start_rerun():
+    """Start recording the script run on this thread"""
+    if not ENABLED:
+        return
+    _install()
+    _local.record = {
+        "start": time.perf_counter(),
+        "from_screen": _current_screen(),
+        "depth": 0,
+        "functions": {},
+        "calls": {},
+        "payload_bytes": 0,
+    }
+
+
+def instrumented(func):
+    """Time calls to `func`; the outermost call closes the rerun record"""
+    if not ENABLED:
+        return func
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        record = _current_record()
+        if record is None:
+            start_rerun()
+            record = _current_record()
+        record["depth"] += 1
+        start = time.perf_counter()
+        outcome = "ok"
+        try:
+            return func(*args, **kwargs)
+        except BaseException as exc:
+            outcome = _OUTCOMES.get(type(exc).__name__, "error")
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            seconds, calls = record["functions"].get(func.__name__, (0.0, 0))
+            record["functions"][func.__name__] = (seconds + elapsed, calls + 1)
+            record["depth"] -= 1
+            if record["depth"] == 0:
+                _finish_rerun(record, outcome)
+
+    return wrapper
+
+
+def _count_call(name, payload_arg, original):
+    """Wrap a Streamlit call so it is counted while a rerun is recorded"""
+
+    @functools.wraps(original)
+    def wrapper(*args, **kwargs):
+        record = _current_record()
+        if record is not None:
+            record["calls"][name] = record["calls"].get(name, 0) + 1
+            if payload_arg is not None and len(args) > payload_arg:
+                record["payload_bytes"] += len(str(args[payload_arg]).encode("utf-8"))
+        return original(*args, **kwargs)
+
+    wrapper._bubbles_counted = True
+    return wrapper
+
+
+def _install():
+    """Patch the counted Streamlit calls and start the metrics endpoint once"""
+    global _log_file, _server
+    with _lock:
+        for (module, name), payload_arg in COUNTED_CALLS.items():
+            original = getattr(module, name)
+            if not getattr(original, "_bubbles_counted", False):
+                setattr(module, name, _count_call(name, payload_arg, original))
+        if _log_file is None:
+            _log_file = open(LOG_PATH, "a", encoding="utf-8")
+        if _server is None and PORT:
+            try:
+                _server = ThreadingHTTPServer(("127.0.0.1", PORT), _MetricsHandler)
+            except OSError:
+                # Another app process on this box already serves the endpoint
+                _server = False
+            else:
+                threading.Thread(target=_server.serve_forever, name="bubbles-metrics", daemon=True).start()
+
+
+def session_state_sizes(state=None):
+    """Approximate bytes held by each session state entry, largest first
+
+    `state` defaults to the running session's; anything with .to_dict()
+    (e.g. an AppTest's session_state) works too.
+    """
+    sizes = {}
+    for key, value in (state if state is not None else st.session_state).to_dict().items():
+        try:
+            sizes[key] = len(pickle.dumps((key, value)))
+        except Exception:
+            # Widgets and other runtime objects are not picklable; skip them
+            continue
+    return dict(sorted(sizes.items(), key=lambda item: item[1], reverse=True))
+
+
+def session_state_bytes(state=None):
+    """Approximate bytes held by a session's state"""
+    return sum(session_state_sizes(state).values())
+
+
+def _current_screen():
+    """Name of the screen the session is on"""
+    if st.session_state.get("show_reward"):
+        return "reward"
+    return st.session_state.get("current_game") or "menu"
+
+
+def _session_id():
+    """Id of the Streamlit session running on this thread"""
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+    ctx = get_script_run_ctx(suppress_warning=True)
+    return ctx.session_id if ctx else None
+
+
+def _finish_rerun(record, outcome):
+    """Write a finished rerun to the JSONL sink and the running totals"""
+    _local.record = None
+    wall = time.perf_counter() - record["start"]
+    screen = _current_screen()
+    state_bytes = session_state_bytes()
+    line = {
+        "ts": time.time(),
+        "session": _session_id(),
+        "from_screen": record["from_screen"],
+        "screen": screen,
+        "outcome": outcome,
+        "wall_ms": round(wall * 1000, 3),
+        "functions": {name: {"ms": round(seconds * 1000, 3), "calls": calls} for name, (seconds, calls) in record["functions"].items()},
+        "calls": record["calls"],
+        "payload_bytes": record["payload_bytes"],
+        "session_state_bytes": state_bytes,
+    }
+
+    with _lock:
+        _log_file.write(json.dumps(line) + "\n")
+        _log_file.flush()
+
+        key = (screen, outcome)
+        _totals["reruns"][key] = _totals["reruns"].get(key, 0) + 1
+        _totals["rerun_seconds"][key] = _totals["rerun_seconds"].get(key, 0.0) + wall
+        for name, (seconds, calls) in record["functions"].items():
+            _totals["function_seconds"][name] = _totals["function_seconds"].get(name, 0.0) + seconds
+            _totals["function_calls"][name] = _totals["function_calls"].get(name, 0) + calls
+        for name, calls in record["calls"].items():
+            _totals["st_calls"][name] = _totals["st_calls"].get(name, 0) + calls
+        _totals["payload_bytes"] += record["payload_bytes"]
+        _totals["session_state_bytes_sum"] += state_bytes
+        _totals["session_state_bytes_max"] = max(_totals["session_state_bytes_max"], state_bytes)
+
+
+def register_gauge(name, help_text, read):
+    """Serve a gauge on the metrics endpoint; `read()` returns [(labels, value)] at scrape time"""
+    with _lock:
+        _gauges[name] = (help_text, read)
+
+
+def render_metrics():
+    """Render the running totals in the Prometheus text format"""
+    lines = []
+
+    def family(name, kind, help_text, samples):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            label_text = ",".join(f'{k}="{v}"' for k, v in labels.items())
+            lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+
+    with _lock:
+        family("bubbles_reruns_total", "counter", "Script runs by screen and outcome.",
+               [({"screen": s, "outcome": o}, n) for (s, o), n in _totals["reruns"].items()])
+        family("bubbles_rerun_seconds_total", "counter", "Wall time of script runs.",
+               [({"screen": s, "outcome": o}, round(v, 6)) for (s, o), v in _totals["rerun_seconds"].items()])
+        family("bubbles_function_seconds_total", "counter", "Inclusive time spent in instrumented functions.",
+               [({"function": f}, round(v, 6)) for f, v in _totals["function_seconds"].items()])
+        family("bubbles_function_calls_total", "counter", "Calls to instrumented functions.",
+               [({"function": f}, n) for f, n in _totals["function_calls"].items()])
+        family("bubbles_st_calls_total", "counter", "Counted Streamlit calls.",
+               [({"call": c}, n) for c, n in _totals["st_calls"].items()])
+        family("bubbles_payload_bytes_total", "counter", "HTML and label bytes passed to Streamlit.",
+               [({}, _totals["payload_bytes"])])
+        family("bubbles_session_state_bytes_sum", "counter", "Session state bytes summed over script runs.",
+               [({}, _totals["session_state_bytes_sum"])])
+        family("bubbles_session_state_bytes_max", "gauge", "Largest session state seen.",
+               [({}, _totals["session_state_bytes_max"])])
+        gauges = list(_gauges.items())
+    for name, (help_text, read) in gauges:
+        family(name, "gauge", help_text, read())
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    """Serve render_metrics() on /metrics"""
+
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = render_metrics().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes are frequent; keep them out of the app log
+        pass
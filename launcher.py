@@ -0,0 +1,172 @@
+"""Start bubble.py on a worker that is already warm when it takes traffic.
+
+A plain `streamlit run` leaves the first visits to pay for importing the app's
+modules, compiling bubble.py and the first render of every screen (theme CSS,
+cached resources, Streamlit's lazily imported element code). The launcher does
+all of that up front, in the process that then serves the app, reports how
+long each phase took, and only then starts the server. Its health check
+(/_stcore/health) doesn't pass until the worker is warm, so a load balancer
+never sends a child to a cold one.
+
+    python launcher.py                        # warm up, then serve
+    python launcher.py --server.port 8502     # other options go to streamlit run
+    python launcher.py --warm-only            # warm up, report and exit
+"""
+import argparse
+import ast
+import importlib
+import os
+import sys
+import threading
+import time
+import urllib.request
+
+LAUNCHED = time.perf_counter()
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bubble.py")
+
+# streamlit run options for a worker, unless given on the command line. A
+# worker never reloads its code, and watching the source tree is what makes
+# a fresh session slow to start.
+WORKER_OPTIONS = {
+    "--server.headless": "true",
+    "--server.fileWatcherType": "none",
+}
+
+# Screens rendered once during warm-up: (name, session state, query params).
+# The reward screen is left out: it would queue a real certificate render and
+# start the certificate worker processes.
+SCREENS = (
+    ("menu", {}, {}),
+    ("counting", {"current_game": "counting"}, {}),
+    ("alphabet", {"current_game": "alphabet"}, {}),
+    ("drawing", {"current_game": "drawing"}, {}),
+    ("shapes", {"current_game": "shapes"}, {}),
+    ("counting in the browser", {"current_game": "counting"}, {"engine": "client"}),
+    ("teacher dashboard", {}, {"view": "teacher"}),
+)
+# Profile the warm-up renders read, so no child's or guest's progress is touched
+WARM_UP_CHILD = "warm-up"
+
+
+def _timed(phases, name, func, *args):
+    """Call `func` and record how long it took under `name`"""
+    start = time.perf_counter()
+    result = func(*args)
+    phases.append((name, time.perf_counter() - start))
+    return result
+
+
+def app_modules(path=APP_PATH):
+    """Modules bubble.py imports at the top, in order"""
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read(), path)
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            modules.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module:
+            modules.append(node.module)
+    return modules
+
+
+def _import_app_modules():
+    for name in app_modules():
+        importlib.import_module(name)
+
+
+def _compile_app():
+    with open(APP_PATH, encoding="utf-8") as f:
+        compile(f.read(), APP_PATH, "exec")
+
+
+def render_screen(state, query):
+    """Run bubble.py once headlessly with the given session state and query"""
+    from streamlit import logger as st_logger
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(APP_PATH, default_timeout=30)
+    # Session state is set from outside a script run; keep those warnings
+    # quiet, but only for the warm-up: the server logs at its own level
+    level = st_logger.get_logger("streamlit").getEffectiveLevel()
+    st_logger.set_log_level("error")
+    try:
+        at.query_params.update({"child": WARM_UP_CHILD, **query})
+        for key, value in state.items():
+            at.session_state[key] = value
+        at.run()
+    finally:
+        st_logger.set_log_level(level)
+    if at.exception:
+        raise RuntimeError(at.exception[0].message)
+
+
+def warm_up():
+    """Do the work a cold worker would do on its first visits; returns [(phase, seconds)]"""
+    phases = []
+    _timed(phases, "import streamlit", importlib.import_module, "streamlit")
+    _timed(phases, "import app modules", _import_app_modules)
+    _timed(phases, "compile bubble.py", _compile_app)
+    for name, state, query in SCREENS:
+        _timed(phases, f"render {name}", render_screen, state, query)
+    from admission import session_gate
+
+    # Headless sessions never close; don't let them hold seats once serving
+    session_gate().reset()
+    return phases
+
+
+def print_phases(phases):
+    width = max(len(name) for name, _ in phases) + 2
+    print(f"{'phase':<{width}}{'seconds':>8}")
+    for name, seconds in phases:
+        print(f"{name:<{width}}{seconds:>8.3f}")
+    print(f"{'warm-up total':<{width}}{sum(seconds for _, seconds in phases):>8.3f}")
+
+
+def _report_ready():
+    """Print once the server answers its health check"""
+    from streamlit import config
+
+    while True:
+        url = f"http://127.0.0.1:{config.get_option('server.port')}/_stcore/health"
+        try:
+            with urllib.request.urlopen(url, timeout=1):
+                break
+        except OSError:
+            time.sleep(0.1)
+    print(f"Serving on port {config.get_option('server.port')}, {time.perf_counter() - LAUNCHED:.2f}s after launch", flush=True)
+
+
+def serve(streamlit_args):
+    """Start the server in this process, with everything warmed up still loaded"""
+    from streamlit.web import cli
+
+    from cards import immutable_cards
+
+    # Picture cards are content-addressed: let browsers keep them for good
+    immutable_cards()
+    given = {arg.split("=", 1)[0] for arg in streamlit_args}
+    for option, value in WORKER_OPTIONS.items():
+        if option not in given:
+            streamlit_args = [option, value, *streamlit_args]
+    threading.Thread(target=_report_ready, name="bubbles-ready", daemon=True).start()
+    sys.argv = ["streamlit", "run", APP_PATH, *streamlit_args]
+    cli.main(prog_name="streamlit")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Warm up bubble.py, report startup phases, then serve it",
+        epilog="Any other options (e.g. --server.port 8502) are passed to streamlit run.",
+    )
+    parser.add_argument("--warm-only", action="store_true", help="warm up and report, but don't start the server")
+    args, streamlit_args = parser.parse_known_args(argv)
+
+    print_phases(warm_up())
+    if not args.warm_only:
+        serve(streamlit_args)
+
+
+if __name__ == "__main__":
+    main()
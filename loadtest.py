@@ -0,0 +1,422 @@
+"""Multi-session load generator for bubble.py.
+
+Starts `streamlit run bubble.py` on a free local port and opens N simulated
+child sessions over Streamlit's websocket protocol (protobuf BackMsg /
+ForwardMsg, the same messages the browser sends). Each child plays through
+the counting, shapes and alphabet screens from the menu, clicking like a
+child would: mostly right answers, some wrong ones, with a pause between
+clicks. Everything runs locally; no network access is needed.
+
+Reports click-to-render latency percentiles (from sending a click to the
+script run it causes finishing), the server's RSS growth per session and its
+CPU time per script run, read from /proc.
+
+    python loadtest.py --sessions 50
+    python loadtest.py --sessions 200 --loops 3 --think 1.0
+    python loadtest.py --url ws://127.0.0.1:8501 --pid 1234   # existing server
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+import websockets
+from streamlit.components.v2.bidi_component.main import _make_trigger_id
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bubble.py")
+
+# Seconds to wait for any one script run before calling the session stuck
+RUN_TIMEOUT = 30
+# How often a child picks the right answer
+ACCURACY = 0.75
+# Clicks a child makes on one screen before going back to the menu
+CLICKS_PER_SCREEN = 6
+
+FINISHED = (ForwardMsg.FINISHED_SUCCESSFULLY, ForwardMsg.FINISHED_FRAGMENT_RUN_SUCCESSFULLY)
+
+# (tag, attributes) of each shape as shape_board draws it
+SVG_SHAPE = re.compile(r'<g transform="[^"]*" data-index="(\d+)"><(\w+)([^>]*)>')
+
+
+class SessionError(Exception):
+    """A simulated session hit an app error or lost its server"""
+
+
+class ChildSession:
+    """One simulated browser tab, tracking the elements on its page"""
+
+    def __init__(self, ws, child, rng, think):
+        self.ws = ws
+        self.query_string = f"child={child}"
+        self.rng = rng
+        self.think = think
+        self.page_script_hash = ""
+        self.page = {}          # delta path -> (element, fragment id)
+        self.auto_reruns = {}   # fragment id -> interval the browser would rerun it at
+        self.latencies = []     # (screen, seconds)
+        self.script_runs = 0
+        self.waited = None      # seconds spent on the waiting screen, if any
+
+    async def _send(self, widget_states=(), fragment_id="", auto=False):
+        msg = BackMsg()
+        state = msg.rerun_script
+        state.query_string = self.query_string
+        state.page_script_hash = self.page_script_hash
+        state.widget_states.widgets.extend(widget_states)
+        state.fragment_id = fragment_id
+        state.is_auto_rerun = auto
+        await self.ws.send(msg.SerializeToString())
+
+    async def _wait_for_render(self):
+        """Read messages until a script run finishes, updating the page"""
+        while True:
+            msg = ForwardMsg()
+            msg.ParseFromString(await asyncio.wait_for(self.ws.recv(), RUN_TIMEOUT))
+            kind = msg.WhichOneof("type")
+            if kind == "new_session":
+                self.page_script_hash = msg.new_session.page_script_hash
+                # A full run redraws the whole page; a fragment run only its part
+                if not msg.new_session.fragment_ids_this_run:
+                    self.page.clear()
+            elif kind == "delta" and msg.delta.WhichOneof("type") == "new_element":
+                element = msg.delta.new_element
+                if element.WhichOneof("type") == "exception":
+                    raise SessionError(element.exception.message)
+                self.page[tuple(msg.metadata.delta_path)] = (element, msg.delta.fragment_id)
+            elif kind == "page_info_changed":
+                # The app rewrote the URL (e.g. added ?sid=); a browser keeps it
+                self.query_string = msg.page_info_changed.query_string
+            elif kind == "auto_rerun":
+                self.auto_reruns[msg.auto_rerun.fragment_id] = msg.auto_rerun.interval
+            elif kind == "stop_auto_rerun":
+                self.auto_reruns.clear()
+            elif kind == "script_finished":
+                self.script_runs += 1
+                if msg.script_finished == ForwardMsg.FINISHED_WITH_COMPILE_ERROR:
+                    raise SessionError("bubble.py failed to compile")
+                if msg.script_finished in FINISHED:
+                    return
+
+    async def rerun(self, screen, widget_states=(), fragment_id="", auto=False):
+        """Send one rerun and time it until the page is drawn"""
+        start = time.perf_counter()
+        await self._send(widget_states, fragment_id, auto)
+        await self._wait_for_render()
+        # Timer-driven reruns aren't clicks; keep them out of the latencies
+        if not auto:
+            self.latencies.append((screen, time.perf_counter() - start))
+
+    async def pause(self):
+        """A child's pause between clicks"""
+        await asyncio.sleep(self.think * self.rng.uniform(0.5, 1.5))
+
+    def _elements(self, kind):
+        for element, fragment_id in self.page.values():
+            if element.WhichOneof("type") == kind:
+                yield getattr(element, kind), fragment_id
+
+    def find_button(self, key):
+        """(button, fragment id) for the button with `key`, or (None, None)"""
+        for button, fragment_id in self._elements("button"):
+            if button.id.endswith(f"-{key}"):
+                return button, fragment_id
+        return None, None
+
+    def markdown(self, needle):
+        """Body of the first markdown element containing `needle`"""
+        for markdown, _ in self._elements("markdown"):
+            if needle in markdown.body:
+                return markdown.body
+        return ""
+
+    async def click(self, screen, key):
+        """Click the button with `key`"""
+        button, fragment_id = self.find_button(key)
+        if button is None:
+            raise SessionError(f"no {key} button on the {screen} screen")
+        state = WidgetState(id=button.id, trigger_value=True)
+        await self.rerun(screen, [state], fragment_id)
+
+    async def trigger(self, screen, key, event, value):
+        """Fire `event` from the custom component with `key`"""
+        for component, fragment_id in self._elements("bidi_component"):
+            if component.id.endswith(f"-{key}"):
+                break
+        else:
+            raise SessionError(f"no {key} component on the {screen} screen")
+        state = WidgetState(id=_make_trigger_id(component.id, "events"))
+        state.json_trigger_value = json.dumps([{"event": event, "value": value}])
+        await self.rerun(screen, [state], fragment_id)
+
+    async def play_counting(self):
+        await self.click("counting", "menu_counting")
+        for _ in range(CLICKS_PER_SCREEN):
+            await self.pause()
+            # Every object is one <g> on the board; count them like a child would
+            count = self.markdown('class="shape-board"').count("<g ")
+            options = [button for button, _ in self._elements("button") if "-counting_option_" in button.id]
+            right = [button for button in options if button.label == str(count)]
+            pick = right[0] if right and self.rng.random() < ACCURACY else self.rng.choice(options)
+            await self.click("counting", pick.id.rsplit("-", 1)[1])
+        await self.click("counting", "counting_back")
+
+    def _shapes_on_board(self):
+        """(index, shape) for every shape still on the shapes board"""
+        for component, _ in self._elements("bidi_component"):
+            if component.id.endswith("-shape_board"):
+                svg = json.loads(component.json)["svg"]
+                break
+        else:
+            return []
+        shapes = []
+        for index, tag, attrs in SVG_SHAPE.findall(svg):
+            if tag == "circle":
+                shape = "circle"
+            elif tag == "rect":
+                width, height = re.search(r'width="(\d+)" height="(\d+)"', attrs).groups()
+                shape = "square" if width == height else "rectangle"
+            else:
+                corners = len(re.search(r'points="([^"]*)"', attrs).group(1).split())
+                shape = {3: "triangle", 4: "diamond"}.get(corners, "star")
+            shapes.append((int(index), shape))
+        return shapes
+
+    async def play_shapes(self):
+        await self.click("shapes", "menu_shapes")
+        for _ in range(CLICKS_PER_SCREEN):
+            await self.pause()
+            if self.markdown("Amazing!"):
+                # Round over: wait out the celebration like the browser's timer would
+                for fragment_id, interval in list(self.auto_reruns.items()):
+                    await asyncio.sleep(interval)
+                    await self.rerun("shapes", fragment_id=fragment_id, auto=True)
+                continue
+            target = re.search(r"Find all the (\w+?)s!", self.markdown("Find all the")).group(1)
+            shapes = self._shapes_on_board()
+            right = [index for index, shape in shapes if shape == target]
+            pick = self.rng.choice(right) if right and self.rng.random() < ACCURACY else self.rng.choice(shapes)[0]
+            await self.trigger("shapes", "shape_board", "clicked", pick)
+        self.auto_reruns.clear()
+        await self.click("shapes", "shapes_back")
+
+    async def play_alphabet(self):
+        await self.click("alphabet", "menu_alphabet")
+        for _ in range(CLICKS_PER_SCREEN // 2):
+            await self.pause()
+            await self.click("alphabet", "alphabet_word")
+            await self.pause()
+            await self.click("alphabet", "alphabet_next")
+        await self.click("alphabet", "alphabet_back")
+
+    async def wait_for_seat(self):
+        """Sit on the waiting screen, polling like the browser would, until the app lets us in"""
+        if not self.markdown("in line"):
+            return
+        start = time.perf_counter()
+        while self.markdown("in line"):
+            for fragment_id, interval in list(self.auto_reruns.items()):
+                await asyncio.sleep(interval)
+                await self.rerun("waiting", fragment_id=fragment_id, auto=True)
+        self.auto_reruns.clear()
+        self.waited = time.perf_counter() - start
+
+    async def play(self, loops):
+        await self.rerun("menu")
+        await self.wait_for_seat()
+        games = [self.play_counting, self.play_shapes, self.play_alphabet]
+        for _ in range(loops):
+            self.rng.shuffle(games)
+            for game in games:
+                await self.pause()
+                await game()
+
+
+def _proc_stats(pid):
+    """(RSS bytes, CPU seconds) of a process, from /proc"""
+    with open(f"/proc/{pid}/status") as f:
+        rss = next(int(line.split()[1]) * 1024 for line in f if line.startswith("VmRSS:"))
+    with open(f"/proc/{pid}/stat") as f:
+        # Fields after the command name; utime and stime are the 12th and 13th
+        fields = f.read().rsplit(")", 1)[1].split()
+    cpu = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    return rss, cpu
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(port, scratch, seats=0):
+    """Run bubble.py under `streamlit run` and wait until it answers"""
+    env = dict(
+        os.environ,
+        BUBBLES_PROGRESS_DB=os.path.join(scratch, "progress.db"),
+        BUBBLES_EVENTS_DIR=os.path.join(scratch, "events"),
+        BUBBLES_CERTIFICATES_DIR=os.path.join(scratch, "certificates"),
+        BUBBLES_MAX_SESSIONS=str(seats),
+    )
+    server = subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", APP_PATH,
+         "--server.headless", "true",
+         "--server.port", str(port),
+         "--server.address", "127.0.0.1",
+         "--server.fileWatcherType", "none",
+         "--browser.gatherUsageStats", "false"],
+        cwd=os.path.dirname(APP_PATH),
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError("streamlit exited during startup")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=1):
+                return server
+        except OSError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError("streamlit did not come up within 60s")
+
+
+async def run_session(url, i, args, sessions, errors, ready):
+    rng = random.Random(f"{args.seed}:{i}")
+    await asyncio.sleep(args.ramp * i / max(1, args.sessions))
+    try:
+        async with websockets.connect(f"{url}/_stcore/stream", subprotocols=["streamlit"], max_size=None) as ws:
+            session = ChildSession(ws, f"load-{i}", rng, args.think)
+            sessions.append(session)
+            await session.play(args.loops)
+            ready.release()
+            # Stay connected so the server still holds every session when RSS is
+            # read; with --seats, leave so the next child in line gets the seat
+            if not args.seats:
+                await asyncio.sleep(3600)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        errors.append(f"session {i}: {type(e).__name__}: {e}")
+        ready.release()
+
+
+async def run_load(url, args, pid=None):
+    """Play every session to the end and return the measurements"""
+    # One throwaway child first, so imports and caches aren't billed to the sessions
+    async with websockets.connect(f"{url}/_stcore/stream", subprotocols=["streamlit"], max_size=None) as ws:
+        await ChildSession(ws, "load-warmup", random.Random(args.seed), 0).play(1)
+
+    sessions, errors = [], []
+    ready = asyncio.Semaphore(0)
+    before = _proc_stats(pid) if pid else None
+    start = time.perf_counter()
+    tasks = [asyncio.create_task(run_session(url, i, args, sessions, errors, ready)) for i in range(args.sessions)]
+    peak_rss = before[0] if before else 0
+    finished = 0
+    while finished < args.sessions:
+        try:
+            await asyncio.wait_for(ready.acquire(), 1)
+            finished += 1
+        except asyncio.TimeoutError:
+            pass
+        if pid:
+            peak_rss = max(peak_rss, _proc_stats(pid)[0])
+    elapsed = time.perf_counter() - start
+    after = _proc_stats(pid) if pid else None
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    return {
+        "elapsed": elapsed,
+        "latencies": [latency for session in sessions for latency in session.latencies],
+        "script_runs": sum(session.script_runs for session in sessions),
+        "sessions": sessions,
+        "errors": errors,
+        "before": before,
+        "after": after,
+        "peak_rss": peak_rss,
+    }
+
+
+def _percentiles(values):
+    cuts = statistics.quantiles(values, n=100, method="inclusive")
+    return cuts[49], cuts[94], cuts[98]
+
+
+def print_report(result, sessions):
+    latencies = result["latencies"]
+    print(f"{sessions} sessions, {len(latencies)} clicks, {result['script_runs']} script runs in {result['elapsed']:.1f}s")
+    if len(latencies) >= 2:
+        print(f"\n{'click-to-render ms':<20}{'clicks':>8}{'p50':>9}{'p95':>9}{'p99':>9}")
+        screens = sorted({screen for screen, _ in latencies})
+        for screen in screens + ["all"]:
+            values = [s * 1000 for name, s in latencies if screen in ("all", name)]
+            if len(values) >= 2:
+                p50, p95, p99 = _percentiles(values)
+                print(f"{screen:<20}{len(values):>8}{p50:>9.1f}{p95:>9.1f}{p99:>9.1f}")
+    waits = [session.waited for session in result["sessions"] if session.waited]
+    if len(waits) >= 2:
+        p50, p95, _ = _percentiles(waits)
+        print(f"\n{len(waits)} session(s) waited for a seat: p50 {p50:.1f}s, p95 {p95:.1f}s, max {max(waits):.1f}s")
+    if result["before"]:
+        (rss_before, cpu_before), (rss_after, cpu_after) = result["before"], result["after"]
+        print(f"\nserver RSS         {rss_before / 2**20:.1f} MiB -> {rss_after / 2**20:.1f} MiB (peak {result['peak_rss'] / 2**20:.1f} MiB)")
+        print(f"RSS per session    {(rss_after - rss_before) / sessions / 1024:.1f} KiB")
+        if result["script_runs"]:
+            print(f"CPU per script run {(cpu_after - cpu_before) / result['script_runs'] * 1000:.2f} ms")
+    if result["errors"]:
+        print(f"\n{len(result['errors'])} session(s) failed:")
+        for line in result["errors"][:10]:
+            print(f"  {line}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=20, help="simulated children")
+    parser.add_argument("--loops", type=int, default=1, help="times each child plays through every game")
+    parser.add_argument("--think", type=float, default=0.5, help="average seconds between a child's clicks")
+    parser.add_argument("--ramp", type=float, default=5.0, help="seconds over which sessions connect")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the children's choices")
+    parser.add_argument("--url", help="use a running server (e.g. ws://127.0.0.1:8501) instead of starting one")
+    parser.add_argument("--pid", type=int, help="server pid to read RSS/CPU from when --url is given")
+    parser.add_argument("--seats", type=int, default=0, help="BUBBLES_MAX_SESSIONS for the started server (0: no limit)")
+    args = parser.parse_args(argv)
+
+    scratch = tempfile.mkdtemp(prefix="bubbles-load-")
+    server = None
+    try:
+        if args.url:
+            url, pid = args.url.rstrip("/"), args.pid
+        else:
+            port = _free_port()
+            server = start_server(port, scratch, args.seats)
+            url, pid = f"ws://127.0.0.1:{port}", server.pid
+        result = asyncio.run(run_load(url, args, pid))
+    finally:
+        if server:
+            server.terminate()
+            server.wait(timeout=10)
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    print_report(result, args.sessions)
+    return 1 if result["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
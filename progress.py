@@ -0,0 +1,267 @@
+"""Persistent per-child progress on local SQLite.
+
+Scores are written behind: `record()` only updates an in-memory batch, and a
+background thread writes the batch to SQLite every FLUSH_INTERVAL seconds,
+when asked to with `request_flush()`, and when the process exits. Reads merge
+the unwritten batch over what's on disk, so they never see stale scores.
+
+Every session in the process shares one store and one connection (see
+`progress_store()`). Rows are keyed by (child, game), so a child's progress
+is one primary-key lookup.
+
+The same database keeps the aggregates the teacher dashboard reads: answer
+totals per (child, game), added to as answer events are written (see
+events.py), and each child's class (?class= in the URL).
+
+Sessions without ?child= play under a guest profile of their own. Guests are
+left out of the dashboard and its answer totals, and their scores are deleted
+once they haven't changed for BUBBLES_GUEST_TTL seconds.
+
+    BUBBLES_PROGRESS_DB   database file (default: progress.db next to the app)
+    BUBBLES_GUEST_TTL     seconds a guest's scores are kept (default: one day)
+"""
+import atexit
+import os
+import sqlite3
+import threading
+import time
+
+import streamlit as st
+
+from session_store import session_key
+
+DB_PATH = os.environ.get(
+    "BUBBLES_PROGRESS_DB",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "progress.db"),
+)
+# Seconds between background writes
+FLUSH_INTERVAL = 2.0
+# Profiles of sessions without ?child=
+GUEST_PREFIX = "guest-"
+GUEST_TTL = float(os.environ.get("BUBBLES_GUEST_TTL") or 86400)
+# Seconds between sweeps for expired guests
+GUEST_SWEEP_INTERVAL = 600.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS progress (
+    child TEXT NOT NULL,
+    game TEXT NOT NULL,
+    score INTEGER NOT NULL,
+    updated REAL NOT NULL,
+    PRIMARY KEY (child, game)
+);
+CREATE TABLE IF NOT EXISTS answers (
+    child TEXT NOT NULL,
+    game TEXT NOT NULL,
+    answers INTEGER NOT NULL,
+    correct INTEGER NOT NULL,
+    response_ms INTEGER NOT NULL,
+    PRIMARY KEY (child, game)
+);
+CREATE TABLE IF NOT EXISTS roster (
+    child TEXT PRIMARY KEY,
+    class TEXT NOT NULL
+);
+"""
+
+UPSERT = """
+INSERT INTO progress (child, game, score, updated) VALUES (?, ?, ?, ?)
+ON CONFLICT (child, game) DO UPDATE SET score = excluded.score, updated = excluded.updated
+"""
+
+ADD_ANSWERS = """
+INSERT INTO answers (child, game, answers, correct, response_ms) VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (child, game) DO UPDATE SET
+    answers = answers + excluded.answers,
+    correct = correct + excluded.correct,
+    response_ms = response_ms + excluded.response_ms
+"""
+
+JOIN_CLASS = """
+INSERT INTO roster (child, class) VALUES (?, ?)
+ON CONFLICT (child) DO UPDATE SET class = excluded.class
+"""
+
+EXPIRE_GUESTS = (
+    "DELETE FROM progress WHERE child LIKE ? AND updated < ?",
+    "DELETE FROM roster WHERE child LIKE ? AND child NOT IN (SELECT child FROM progress)",
+    # Only left by versions that still added guests to the totals
+    "DELETE FROM answers WHERE child LIKE ?",
+)
+
+
+def is_guest(child):
+    """Whether a profile belongs to a session without ?child="""
+    return child.startswith(GUEST_PREFIX)
+
+
+def _answer_rows(totals):
+    """Rows for ADD_ANSWERS; guests don't count towards the dashboard"""
+    return [(child, game, *counts) for (child, game), counts in totals.items() if not is_guest(child)]
+
+
+class ProgressStore:
+    """Scores per (child, game), written to SQLite in background batches"""
+
+    def __init__(self, path=None, flush_interval=FLUSH_INTERVAL, guest_ttl=GUEST_TTL):
+        self.path = path or DB_PATH
+        self.flush_interval = flush_interval
+        self.guest_ttl = guest_ttl
+        self._last_guest_sweep = float("-inf")
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+        # _db guards the connection; _batch guards only the pending dict, so
+        # record() never waits on a write in progress
+        self._db = threading.Lock()
+        self._batch = threading.Lock()
+        self._pending = {}
+        self._pending_roster = {}
+        self._wake = threading.Event()
+        self._closed = False
+        self._writer = threading.Thread(target=self._run, name="bubbles-progress", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    def record(self, child, game, score):
+        """Queue a child's latest score for a game; returns without touching disk"""
+        with self._batch:
+            self._pending[(child, game)] = (score, time.time())
+
+    def scores(self, child):
+        """{game: score} for a child, including scores not written yet"""
+        with self._db:
+            rows = self._conn.execute("SELECT game, score FROM progress WHERE child = ?", (child,)).fetchall()
+            scores = dict(rows)
+            with self._batch:
+                for (pending_child, game), (score, _) in self._pending.items():
+                    if pending_child == child:
+                        scores[game] = score
+        return scores
+
+    def join_class(self, child, class_name):
+        """Queue the class a child belongs to; written with the next batch"""
+        with self._batch:
+            self._pending_roster[child] = class_name
+
+    def add_answers(self, totals):
+        """Add {(child, game): (answers, correct, response_ms)} to the answer totals"""
+        with self._db, self._conn:
+            self._conn.executemany(ADD_ANSWERS, _answer_rows(totals))
+
+    def backfill_answers(self, load_totals):
+        """Fill empty answer totals from earlier history; `load_totals()` is only called then
+
+        Processes starting together can all find the totals empty, so the
+        check is repeated in the same write transaction as the insert and
+        only the first one in fills them.
+        """
+        with self._db:
+            if self._conn.execute("SELECT 1 FROM answers LIMIT 1").fetchone():
+                return
+        totals = load_totals()
+        with self._db, self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            if not self._conn.execute("SELECT 1 FROM answers LIMIT 1").fetchone():
+                self._conn.executemany(ADD_ANSWERS, _answer_rows(totals))
+
+    def school_report(self):
+        """Class, scores and answer totals of every child, including unwritten scores
+
+        Guest profiles are left out. Returns {child: {"class": name or None, "scores": {game: score},
+        "answers": {game: (answers, correct, response_ms)}}}.
+        """
+        report = {}
+
+        def entry(child):
+            # Guests fill a throwaway entry that never reaches the report
+            if is_guest(child):
+                return {"class": None, "scores": {}, "answers": {}}
+            if child not in report:
+                report[child] = {"class": None, "scores": {}, "answers": {}}
+            return report[child]
+
+        with self._db:
+            for child, game, score in self._conn.execute("SELECT child, game, score FROM progress"):
+                entry(child)["scores"][game] = score
+            for child, game, *counts in self._conn.execute("SELECT child, game, answers, correct, response_ms FROM answers"):
+                entry(child)["answers"][game] = tuple(counts)
+            for child, class_name in self._conn.execute("SELECT child, class FROM roster"):
+                entry(child)["class"] = class_name
+            with self._batch:
+                for (child, game), (score, _) in self._pending.items():
+                    entry(child)["scores"][game] = score
+                for child, class_name in self._pending_roster.items():
+                    entry(child)["class"] = class_name
+        return report
+
+    def flush(self):
+        """Write the pending batch now; returns the number of rows written"""
+        with self._db:
+            with self._batch:
+                batch, self._pending = self._pending, {}
+                roster, self._pending_roster = self._pending_roster, {}
+            if not batch and not roster:
+                return 0
+            with self._conn:
+                self._conn.executemany(UPSERT, [(child, game, score, updated) for (child, game), (score, updated) in batch.items()])
+                self._conn.executemany(JOIN_CLASS, roster.items())
+        return len(batch) + len(roster)
+
+    def expire_guests(self, now=None):
+        """Delete guest profiles whose scores haven't changed for guest_ttl seconds"""
+        cutoff = (now or time.time()) - self.guest_ttl
+        with self._db, self._conn:
+            self._conn.execute(EXPIRE_GUESTS[0], (GUEST_PREFIX + "%", cutoff))
+            self._conn.execute(EXPIRE_GUESTS[1], (GUEST_PREFIX + "%",))
+            self._conn.execute(EXPIRE_GUESTS[2], (GUEST_PREFIX + "%",))
+
+    def request_flush(self):
+        """Ask the writer thread to flush soon without waiting for it"""
+        self._wake.set()
+
+    def _run(self):
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+            if time.monotonic() - self._last_guest_sweep >= GUEST_SWEEP_INTERVAL:
+                self._last_guest_sweep = time.monotonic()
+                self.expire_guests()
+
+    def close(self):
+        """Flush what's left and stop the writer"""
+        if self._closed:
+            return
+        self._closed = True
+        self._wake.set()
+        self._writer.join()
+        self.flush()
+        self._conn.close()
+
+
+@st.cache_resource
+def progress_store():
+    """The progress store shared by every session in this process"""
+    return ProgressStore()
+
+
+def current_child():
+    """Profile the child's work is saved under; ?child= in the URL
+
+    Without one, each session gets a guest profile of its own (keyed by its
+    session token), so anonymous children never share scores.
+    """
+    return st.query_params.get("child") or f"{GUEST_PREFIX}{session_key()}"
+
+
+def child_name():
+    """The child's name as shown on screen and on certificates"""
+    return st.query_params.get("child") or "guest"
+
+
+def current_class():
+    """The class the child is in, from ?class= in the URL, or None"""
+    return st.query_params.get("class")
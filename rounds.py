@@ -0,0 +1,210 @@
+"""Seeded, batched round generation for the counting and shapes games.
+
+Rounds are generated ahead of time in batches and queued per session, so an
+answer click only pops the next round off the queue. Every round carries its
+own seed: `replay_round(game, seed)` rebuilds exactly the round a parent
+reported, and `?seed=` in the URL replays a whole session's sequence.
+
+Boards are int-coded and packed into a few bytes (see Board), and a pool only
+keeps a counter to derive its next seeds from, so a session's queued rounds
+stay small.
+"""
+import random
+import time
+from collections import deque
+
+import streamlit as st
+
+from content import palette, shape_sets
+
+BATCH_SIZE = 10
+# Top the queue up once it runs this low
+REFILL_BELOW = 3
+
+# Seconds each game celebrates a finished round before the next one starts
+ROUND_TRANSITION_DELAY = {
+    "counting": 0.0,
+    "shapes": 2.0,
+}
+
+# Int codes boards store instead of names. Which of them each game uses is
+# up to the content packs (see content.py); append new names, never reorder.
+COLORS = ['red', 'green', 'blue', 'yellow', 'purple', 'orange']
+SHAPES = ['circle', 'square', 'triangle', 'star', 'rectangle', 'diamond']
+SHAPE_CODES = {shape: i for i, shape in enumerate(SHAPES)}
+COLOR_CODES = {color: i for i, color in enumerate(COLORS)}
+
+
+class Board:
+    """A round's (shape, color, size) objects packed three bytes per object
+
+    Indexing and iterating give back (shape, color, size) tuples, so a board
+    reads like the list it replaces. Boards are hashable, which lets the
+    renderer cache their markup.
+    """
+    __slots__ = ("packed",)
+
+    def __init__(self, objects):
+        self.packed = bytes(
+            code for shape, color, size in objects
+            for code in (SHAPE_CODES[shape], COLOR_CODES[color], size)
+        )
+
+    def __len__(self):
+        return len(self.packed) // 3
+
+    def __getitem__(self, index):
+        shape, color, size = self.packed[3 * index:3 * index + 3]
+        return SHAPES[shape], COLORS[color], size
+
+    def __iter__(self):
+        packed = self.packed
+        for i in range(0, len(packed), 3):
+            yield SHAPES[packed[i]], COLORS[packed[i + 1]], packed[i + 2]
+
+    def __eq__(self, other):
+        return isinstance(other, Board) and self.packed == other.packed
+
+    def __hash__(self):
+        return hash(self.packed)
+
+    def count(self, shape):
+        """How many objects on the board are `shape`"""
+        return self.packed[0::3].count(SHAPE_CODES[shape])
+
+
+def counting_round(rng):
+    """Objects to count, the answer, the question and shuffled answer options"""
+    shapes = shape_sets()
+    colors = palette("rounds")
+    count = rng.randint(3, 10)
+    objects = Board((rng.choice(shapes["counting"]), rng.choice(colors), 90) for _ in range(count))
+    question = f"How many {rng.choice(shapes['counting_questions'])} do you see?"
+
+    # Answer options are fixed for the round so reruns don't reshuffle them
+    wrong_options = [count - 1, count + 1, count + 2]
+    wrong_options = [opt for opt in wrong_options if opt > 0 and opt != count]
+    if len(wrong_options) < 3:
+        wrong_options.extend([count - 2, count + 3, count - 3])
+        wrong_options = [opt for opt in wrong_options if opt > 0 and opt != count]
+    options = [count] + rng.sample(wrong_options, min(3, len(wrong_options)))
+    rng.shuffle(options)
+
+    return {"objects": objects, "answer": count, "question": question, "options": options}
+
+
+def shapes_round(rng):
+    """6-10 shapes and a target shape that appears at least once"""
+    shapes = shape_sets()["shapes"]
+    colors = palette("rounds")
+    target = rng.choice(shapes)
+    objects = [
+        (rng.choice(shapes), rng.choice(colors), rng.randint(40, 80))
+        for _ in range(rng.randint(6, 10))
+    ]
+
+    # Ensure at least one target shape exists
+    if not any(obj[0] == target for obj in objects):
+        idx = rng.randint(0, len(objects) - 1)
+        objects[idx] = (target, objects[idx][1], objects[idx][2])
+
+    return {"objects": Board(objects), "target": target}
+
+
+GENERATORS = {
+    "counting": counting_round,
+    "shapes": shapes_round,
+}
+
+
+def replay_round(game, seed):
+    """Rebuild the round with the given seed"""
+    round_ = GENERATORS[game](random.Random(seed))
+    round_["seed"] = seed
+    return round_
+
+
+def round_seed(session_seed, game, n):
+    """Seed of the n-th round a session plays of a game"""
+    # Each game gets its own stream so playing one doesn't shift the other
+    return random.Random(f"{session_seed}:{game}:{n}").getrandbits(32)
+
+
+def generate_rounds(game, session_seed, start, count=BATCH_SIZE):
+    """Generate rounds start..start+count-1 of a session's sequence"""
+    return [replay_round(game, round_seed(session_seed, game, n)) for n in range(start, start + count)]
+
+
+def _session_seed():
+    """Seed for this session's rounds: ?seed= if given, else a fresh one"""
+    if 'round_seed' not in st.session_state:
+        seed = st.query_params.get("seed")
+        st.session_state.round_seed = int(seed) if seed and seed.isdigit() else random.getrandbits(32)
+    return st.session_state.round_seed
+
+
+def _pool(game):
+    """This session's queue of upcoming rounds for a game"""
+    if 'round_pools' not in st.session_state:
+        st.session_state.round_pools = {}
+    pools = st.session_state.round_pools
+    if game not in pools:
+        pools[game] = {"generated": 0, "queue": deque()}
+        _refill(pools[game], game)
+    return pools[game]
+
+
+def _refill(pool, game):
+    """Queue the next batch of a game's rounds"""
+    pool["queue"].extend(generate_rounds(game, _session_seed(), pool["generated"]))
+    pool["generated"] += BATCH_SIZE
+
+
+def next_round(game):
+    """Pop the next round for a game"""
+    pool = _pool(game)
+    if not pool["queue"]:
+        _refill(pool, game)
+    return pool["queue"].popleft()
+
+
+def top_up_rounds(game):
+    """Refill a game's queue ahead of time; call after the board is drawn"""
+    pool = _pool(game)
+    if len(pool["queue"]) < REFILL_BELOW:
+        _refill(pool, game)
+
+
+def finish_round(game):
+    """Start the celebration that ends a game's round"""
+    st.session_state[f"{game}_next_round_at"] = time.time() + ROUND_TRANSITION_DELAY[game]
+
+
+def round_finished(game):
+    """Whether a game's round is over and waiting for the next one"""
+    return st.session_state.get(f"{game}_next_round_at") is not None
+
+
+def schedule_next_round(game, start_next_round):
+    """Call `start_next_round` once the game's celebration delay has passed
+
+    Instead of sleeping in the script thread, this mounts a fragment that the
+    browser reruns every `delay` seconds. It does nothing until the deadline
+    set by finish_round() has passed, then starts the next round and reruns
+    the app so the new board is drawn.
+    """
+    deadline_key = f"{game}_next_round_at"
+    delay = ROUND_TRANSITION_DELAY[game]
+
+    @st.fragment(run_every=delay if delay > 0 else None)
+    def round_transition():
+        # The deadline is gone once the round moved on (or the session was cleared)
+        deadline = st.session_state.get(deadline_key)
+        if deadline is None:
+            return
+        if time.time() >= deadline:
+            st.session_state[deadline_key] = None
+            start_next_round()
+            st.rerun()
+
+    round_transition()
@@ -0,0 +1,249 @@
+"""Pluggable store for each session's game state.
+
+The game and progress fields of st.session_state (FIELDS) are snapshotted
+to a backend after every script run that changed them, keyed by a session
+token kept in the URL (?sid=). Whenever the backend holds a newer snapshot
+than the session last saw, the session picks it up first. So a session can
+be served by a different app process, or by the same process after a
+restart or a reload, without losing the round in progress.
+
+    BUBBLES_STATE_BACKEND   memory (default): snapshots live in this process
+                            sqlite: snapshots shared by every process on the host
+    BUBBLES_STATE_DB        database file for the sqlite backend
+                            (default: sessions.db next to the app)
+
+New backends only need version(), load() and save(); add them to BACKENDS.
+"""
+import functools
+import hashlib
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import streamlit as st
+from streamlit.runtime import Runtime
+from streamlit.runtime.scriptrunner import RerunException, StopException, get_script_run_ctx
+
+# Game and progress fields that follow a session between processes. Widget
+# values and per-render flags stay local.
+FIELDS = (
+    "current_game", "show_reward", "mascot_message",
+    "counting_score", "alphabet_score", "shapes_score",
+    "counting_objects", "counting_answer", "counting_question", "counting_options",
+    "counting_round", "counting_feedback", "counting_next_round_at",
+    "current_letter", "show_word",
+    "shapes_game_objects", "target_shape", "found_shapes", "shapes_round",
+    "shapes_feedback", "shapes_next_round_at",
+    "round_seed", "round_pools",
+    "counting_asked_at", "shapes_asked_at", "alphabet_asked_at",
+    "counting_browser_rounds", "counting_browser_applied",
+    "shapes_browser_rounds", "shapes_browser_applied",
+    "drawing_strokes",
+)
+
+# Sessions the in-process backend remembers; the least recently saved go first
+MAX_SNAPSHOTS = 10_000
+# Seconds a shared snapshot is kept after its last save
+SNAPSHOT_TTL = 7 * 24 * 3600
+
+DB_PATH = os.environ.get(
+    "BUBBLES_STATE_DB",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "sessions.db"),
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    key TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    state BLOB NOT NULL,
+    updated REAL NOT NULL
+)
+"""
+
+UPSERT = """
+INSERT INTO sessions (key, version, state, updated) VALUES (?, 1, ?, ?)
+ON CONFLICT (key) DO UPDATE SET version = version + 1, state = excluded.state, updated = excluded.updated
+RETURNING version
+"""
+
+
+class InProcessBackend:
+    """Snapshots in this process's memory; survive reloads, not restarts"""
+
+    def __init__(self, max_snapshots=MAX_SNAPSHOTS):
+        self.max_snapshots = max_snapshots
+        self._snapshots = OrderedDict()
+        self._lock = threading.Lock()
+
+    def version(self, key):
+        """Version of the latest snapshot for `key`, 0 if there is none"""
+        return self._snapshots.get(key, (0, None))[0]
+
+    def load(self, key):
+        """(version, state bytes) of the latest snapshot, or None"""
+        return self._snapshots.get(key)
+
+    def save(self, key, state):
+        """Store a new snapshot and return its version"""
+        with self._lock:
+            version = self.version(key) + 1
+            self._snapshots[key] = (version, state)
+            self._snapshots.move_to_end(key)
+            if len(self._snapshots) > self.max_snapshots:
+                self._snapshots.popitem(last=False)
+        return version
+
+
+class SQLiteBackend:
+    """Snapshots in a SQLite file shared by every app process on the host"""
+
+    def __init__(self, path=None):
+        self.path = path or DB_PATH
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(SCHEMA)
+        self._conn.execute("DELETE FROM sessions WHERE updated < ?", (time.time() - SNAPSHOT_TTL,))
+        self._conn.commit()
+        self._lock = threading.Lock()
+
+    def version(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT version FROM sessions WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else 0
+
+    def load(self, key):
+        with self._lock:
+            return self._conn.execute("SELECT version, state FROM sessions WHERE key = ?", (key,)).fetchone()
+
+    def save(self, key, state):
+        with self._lock, self._conn:
+            (version,) = self._conn.execute(UPSERT, (key, state, time.time())).fetchone()
+        return version
+
+
+BACKENDS = {
+    "memory": InProcessBackend,
+    "sqlite": SQLiteBackend,
+}
+
+
+@st.cache_resource
+def state_backend():
+    """The backend picked by BUBBLES_STATE_BACKEND, shared by the process"""
+    return BACKENDS[os.environ.get("BUBBLES_STATE_BACKEND", "memory")]()
+
+
+# Token -> id of the session in this process that holds it, least recently used first
+_holders = OrderedDict()
+_holders_lock = threading.Lock()
+
+
+def _claim(key):
+    """Hold `key` for this session, unless another open session in this process holds it"""
+    ctx = get_script_run_ctx()
+    if ctx is None:
+        return True
+    with _holders_lock:
+        holder = _holders.get(key)
+        if holder not in (None, ctx.session_id) and Runtime.exists() and Runtime.instance().is_active_session(holder):
+            return False
+        _holders[key] = ctx.session_id
+        _holders.move_to_end(key)
+        if len(_holders) > MAX_SNAPSHOTS:
+            _holders.popitem(last=False)
+    return True
+
+
+def session_key():
+    """This session's token; added to the URL so reloads and other processes find it
+
+    A token still held by another open tab (say a teacher copied the address
+    bar for the whole class) is swapped for a fresh one, so the tabs don't
+    share one game.
+    """
+    key = st.query_params.get("sid")
+    if key is None or not _claim(key):
+        key = uuid.uuid4().hex
+        _claim(key)
+        st.query_params["sid"] = key
+    return key
+
+
+def _sync():
+    """Version and digest of the snapshot this session last loaded or saved"""
+    if "state_sync" not in st.session_state:
+        st.session_state.state_sync = {"version": 0, "digest": None}
+    return st.session_state.state_sync
+
+
+def restore_session():
+    """Load the stored snapshot if it is newer than what this session has"""
+    sync = _sync()
+    key = session_key()
+    backend = state_backend()
+    if backend.version(key) <= sync["version"]:
+        return
+    version, state = backend.load(key)
+    snapshot = pickle.loads(state)
+    for field in FIELDS:
+        if field in snapshot:
+            st.session_state[field] = snapshot[field]
+        elif field in st.session_state:
+            del st.session_state[field]
+    sync["version"] = version
+    sync["digest"] = hashlib.blake2b(state, digest_size=16).digest()
+
+
+def save_session():
+    """Store this session's fields if they changed since the last snapshot"""
+    sync = _sync()
+    snapshot = {field: st.session_state[field] for field in FIELDS if field in st.session_state}
+    state = pickle.dumps(snapshot, protocol=pickle.HIGHEST_PROTOCOL)
+    digest = hashlib.blake2b(state, digest_size=16).digest()
+    if digest == sync["digest"]:
+        return
+    sync["version"] = state_backend().save(session_key(), state)
+    sync["digest"] = digest
+    sync["saved_at"] = time.time()
+
+
+_depth = threading.local()
+
+
+def persisted(func):
+    """Restore before `func` and save after it; only the outermost call syncs
+
+    Use on main() and on every fragment, since fragment reruns skip main().
+    Runs that end in st.rerun() or st.stop() are saved too; errors are not.
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        depth = getattr(_depth, "value", 0)
+        if depth == 0:
+            ctx = get_script_run_ctx()
+            # The session's state was cleared for idling (see admission.py):
+            # run the whole app, so it is admitted and restored like a new tab
+            if ctx and ctx.fragment_ids_this_run and "state_sync" not in st.session_state:
+                st.rerun()
+            restore_session()
+        _depth.value = depth + 1
+        finished = False
+        try:
+            result = func(*args, **kwargs)
+            finished = True
+        except (RerunException, StopException):
+            finished = True
+            raise
+        finally:
+            _depth.value = depth
+            if depth == 0 and finished:
+                save_session()
+        return result
+
+    return wrapper
@@ -0,0 +1,116 @@
+"""Shape board rendering shared by the counting and shapes games.
+
+A whole board is drawn as one SVG, so a round costs a single element instead
+of one st.markdown per object inside st.columns. Each shape's markup is
+memoized by (shape, color, size), and every shape carries its object index so
+clicks on the clickable board map straight back to the round's objects.
+The board is styled by the .shape-board rules in the app theme.
+"""
+import functools
+import math
+
+import streamlit as st
+
+# Size of one grid cell in SVG units, and cells per row
+CELL = 110
+COLUMNS = 5
+
+# Mounted once per rerun; only the data changes between rounds
+BOARD_JS = """
+export default function(component) {
+    const { data, setTriggerValue, parentElement } = component;
+    let board = parentElement.querySelector('.shape-board');
+    if (!board) {
+        board = document.createElement('div');
+        board.className = 'shape-board';
+        parentElement.appendChild(board);
+        board.addEventListener('click', (e) => {
+            const shape = e.target.closest('[data-index]');
+            if (shape) {
+                setTriggerValue('clicked', Number(shape.dataset.index));
+            }
+        });
+    }
+    if (board.dataset.svg !== data.svg) {
+        board.dataset.svg = data.svg;
+        board.innerHTML = data.svg;
+    }
+}
+"""
+
+_board_component = st.components.v2.component(
+    "shape_board",
+    js=BOARD_JS,
+    isolate_styles=False,
+)
+
+
+def _points(coords):
+    """Format (x, y) pairs for an SVG points attribute"""
+    return " ".join(f"{x:.0f},{y:.0f}" for x, y in coords)
+
+
+@functools.lru_cache(maxsize=1024)
+def shape_svg(shape, color, size):
+    """SVG markup for one shape centred in a CELL x CELL box"""
+    c = CELL // 2
+    half = size // 2
+    if shape == 'circle':
+        return f'<circle cx="{c}" cy="{c}" r="{half}" fill="{color}"/>'
+    if shape == 'square':
+        return f'<rect x="{c - half}" y="{c - half}" width="{size}" height="{size}" fill="{color}"/>'
+    if shape == 'rectangle':
+        return f'<rect x="{c - half}" y="{c - size // 4}" width="{size}" height="{half}" fill="{color}"/>'
+    if shape == 'triangle':
+        coords = [(c, c - half), (c + half, c + half), (c - half, c + half)]
+        return f'<polygon points="{_points(coords)}" fill="{color}"/>'
+    if shape == 'diamond':
+        coords = [(c, c - half), (c + half / 2, c), (c, c + half), (c - half / 2, c)]
+        return f'<polygon points="{_points(coords)}" fill="{color}"/>'
+    if shape == 'star':
+        coords = []
+        for k in range(10):
+            radius = half if k % 2 == 0 else half * 0.4
+            angle = math.pi * k / 5 - math.pi / 2
+            coords.append((c + radius * math.cos(angle), c + radius * math.sin(angle)))
+        return f'<polygon points="{_points(coords)}" fill="{color}"/>'
+    raise ValueError(f"Unknown shape: {shape}")
+
+
+@functools.lru_cache(maxsize=256)
+def _board_svg(objects, hidden, clickable):
+    """Render a board of (shape, color, size) objects as one SVG"""
+    rows = max(1, math.ceil(len(objects) / COLUMNS))
+    width = CELL * min(COLUMNS, max(1, len(objects)))
+    parts = [f'<svg viewBox="0 0 {width} {CELL * rows}" xmlns="http://www.w3.org/2000/svg">']
+    for i, (shape, color, size) in enumerate(objects):
+        # Found shapes leave an empty cell so the others don't move
+        if i in hidden:
+            continue
+        x = (i % COLUMNS) * CELL
+        y = (i // COLUMNS) * CELL
+        index = f' data-index="{i}"' if clickable else ''
+        parts.append(f'<g transform="translate({x} {y})"{index}>{shape_svg(shape, color, size)}</g>')
+    parts.append('</svg>')
+    return "".join(parts)
+
+
+def board_svg(objects, hidden=(), clickable=False):
+    """The board as one SVG; clickable boards tag each shape with data-index"""
+    return _board_svg(tuple(objects), frozenset(hidden), clickable)
+
+
+def board_html(objects, hidden=()):
+    """Static board markup for st.markdown"""
+    return f'<div class="shape-board">{board_svg(objects, hidden)}</div>'
+
+
+def clickable_board(objects, hidden=(), key=None):
+    """Draw a board and return the index of the shape clicked this run, if any"""
+    svg = board_svg(objects, hidden, clickable=True)
+    result = _board_component(
+        key=key,
+        data={"svg": svg},
+        on_clicked_change=lambda: None,
+    )
+    return result.clicked
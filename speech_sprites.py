@@ -0,0 +1,82 @@
+"""Build the speech sprite packs game.html plays numbers and letters from.
+
+Record one WAV clip per bubble label, named after the label exactly as it
+shows on the bubble, with one folder per language:
+
+    recordings/en/1.wav ... recordings/en/20.wav, recordings/en/A.wav ...
+    recordings/es/uno.wav ... recordings/es/veinte.wav, recordings/es/Ñ.wav ...
+
+then run
+
+    python speech_sprites.py recordings
+
+to write audio/speech-<lang>.wav and audio/speech-<lang>.json next to
+game.html. A language's clips must share one sample rate, sample width and
+channel count. Labels without a clip are spoken by the browser instead.
+"""
+import argparse
+import json
+import os
+import unicodedata
+import wave
+
+AUDIO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "audio")
+# Silence between clips, so a sprite never plays into the next one
+GAP = 0.05
+
+
+def build_pack(clip_dir, lang, out_dir=AUDIO_DIR):
+    """Join a language's clips into one WAV and write its manifest; returns the manifest"""
+    clips = sorted(name for name in os.listdir(clip_dir) if name.lower().endswith(".wav"))
+    if not clips:
+        raise SystemExit(f"No .wav clips in {clip_dir}")
+    os.makedirs(out_dir, exist_ok=True)
+
+    audio = f"speech-{lang}.wav"
+    sprites = {}
+    fmt = None
+    position = 0
+    with wave.open(os.path.join(out_dir, audio), "wb") as out:
+        for name in clips:
+            with wave.open(os.path.join(clip_dir, name), "rb") as clip:
+                channels, width, rate = clip.getnchannels(), clip.getsampwidth(), clip.getframerate()
+                if fmt is None:
+                    fmt = (channels, width, rate)
+                    out.setnchannels(channels)
+                    out.setsampwidth(width)
+                    out.setframerate(rate)
+                    # 8-bit WAV is unsigned, so its silence is 0x80
+                    gap = (b"\x80" if width == 1 else b"\0") * (int(GAP * rate) * channels * width)
+                elif (channels, width, rate) != fmt:
+                    raise SystemExit(f"{name}: format differs from {clips[0]}")
+                frames = clip.getnframes()
+                out.writeframes(clip.readframes(frames))
+            out.writeframes(gap)
+            # File names from macOS come decomposed; bubbles show composed text
+            label = unicodedata.normalize("NFC", os.path.splitext(name)[0])
+            sprites[label] = [round(position / rate, 4), round(frames / rate, 4)]
+            position += frames + len(gap) // (channels * width)
+
+    manifest = {"audio": audio, "sprites": sprites}
+    with open(os.path.join(out_dir, f"speech-{lang}.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build speech sprite packs for game.html")
+    parser.add_argument("recordings", help="folder with one subfolder of WAV clips per language (en, es)")
+    parser.add_argument("--out", default=AUDIO_DIR, help="where to write the packs (default: audio/ next to game.html)")
+    args = parser.parse_args()
+
+    for lang in sorted(os.listdir(args.recordings)):
+        clip_dir = os.path.join(args.recordings, lang)
+        if not os.path.isdir(clip_dir):
+            continue
+        sprites = build_pack(clip_dir, lang, args.out)["sprites"]
+        seconds = sum(duration for _, duration in sprites.values())
+        print(f"{lang}: {len(sprites)} clips, {seconds:.1f}s of speech")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Theme stylesheet served once as a cached static asset.
+
+The theme lives in static/theme.css and is served by Streamlit's static file
+serving (turned on in .streamlit/config.toml). Every rerun only sends a short
+<link> whose URL carries a fingerprint of the file's contents, so browsers
+keep the sheet cached across reruns and sessions and fetch it again only when
+it changes.
+
+    python theme.py      # fail if the stylesheet grew past its size budget
+"""
+import functools
+import hashlib
+import os
+import sys
+
+import streamlit as st
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+THEME_PATH = os.path.join(STATIC_DIR, "theme.css")
+THEME_URL = "app/static/theme.css"
+
+# Growing past this means the theme needs a trim, not a bigger budget
+CSS_BUDGET_BYTES = 6 * 1024
+
+
+@functools.lru_cache(maxsize=4)
+def _read_theme(mtime):
+    """Read the stylesheet and fingerprint it; cached per file version"""
+    with open(THEME_PATH, "rb") as f:
+        css = f.read()
+    return css.decode("utf-8"), hashlib.sha256(css).hexdigest()[:12]
+
+
+def theme_css():
+    """The stylesheet and its content fingerprint"""
+    return _read_theme(os.stat(THEME_PATH).st_mtime_ns)
+
+
+def theme_link():
+    """<link> tag for the fingerprinted stylesheet"""
+    _, fingerprint = theme_css()
+    return f'<link rel="stylesheet" href="{THEME_URL}?v={fingerprint}">'
+
+
+def load_theme():
+    """Link the theme; inline it if static serving is turned off"""
+    if st.get_option("server.enableStaticServing"):
+        st.markdown(theme_link(), unsafe_allow_html=True)
+    else:
+        css, _ = theme_css()
+        st.markdown(f"<style>{css}</style>", unsafe_allow_html=True)
+
+
+def check_budget(budget=CSS_BUDGET_BYTES):
+    """Return (size, ok) for the stylesheet against its size budget"""
+    size = os.path.getsize(THEME_PATH)
+    return size, size <= budget
+
+
+if __name__ == "__main__":
+    size, ok = check_budget()
+    print(f"static/theme.css: {size} bytes (budget {CSS_BUDGET_BYTES})")
+    sys.exit(0 if ok else 1)
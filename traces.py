@@ -0,0 +1,170 @@
+"""Opt-in recording of anonymized click traces, replayed by benchmark.py.
+
+Set BUBBLES_TRACES to the share of sessions to record: 1 records every
+session, 0.05 about one in twenty. A recorded session appends one JSON line
+per click to traces/trace-<random id>.jsonl (BUBBLES_TRACES_DIR overrides the
+directory):
+
+    {"t": 12.3, "screen": "counting", "action": "counting_option_2", "ms": 41.0}
+
+`t` is seconds since the session started and `ms` the time the app's code
+spent on the click, including the reruns it triggered. `action` is a button key, a
+[component key, event, value] list, or null for a run nobody clicked for (a
+page load or a timer). The first line to know the session's round seed
+carries it as `seed` (see rounds.py), so a replay plays the same rounds.
+Nothing identifies the child: names, classes and session ids aren't written,
+and drawings are cut down to their point counts.
+
+    python benchmark.py --traces traces/            # replay and report
+    python benchmark.py --traces traces/ --save     # write traces_baseline.json
+    python benchmark.py --traces traces/ --compare  # fail if a path got slower
+
+When the variable is not set `traced` returns the function unchanged.
+"""
+import functools
+import json
+import os
+import random
+import re
+import threading
+import time
+import uuid
+
+import streamlit as st
+
+from drawing_canvas import BRUSH_SIZES
+
+SAMPLE = float(os.environ.get("BUBBLES_TRACES") or 0)
+TRACES_DIR = os.environ.get(
+    "BUBBLES_TRACES_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "traces"),
+)
+
+# Button keys worth recording; keep in step with the keys in bubble.py
+BUTTONS = re.compile(
+    r"menu_(counting|alphabet|drawing|shapes)|counting_option_\d+|alphabet_(prev|word|next)"
+    r"|(counting|alphabet|drawing|shapes|reward)_back|drawing_save|view_certificate"
+)
+# Custom components whose events are clicks
+COMPONENTS = ("shape_board", "counting_browser", "shapes_browser", "drawing_canvas")
+# Query parameters that change what a replay renders
+REPLAYED_PARAMS = ("engine",)
+
+_depth = threading.local()
+
+
+def _screen():
+    """The screen the child was on when the run started"""
+    if st.session_state.get("show_reward"):
+        return "reward"
+    return st.session_state.get("current_game") or "menu"
+
+
+def _anonymize(key, event, value):
+    """A component event's value, with drawings cut down to point counts"""
+    if key == "drawing_canvas" and event == "strokes":
+        return {"base": value["base"], "points": [len(stroke["p"]) // 2 for stroke in value["strokes"]]}
+    return value
+
+
+def replay_value(key, event, value):
+    """The value to send when replaying an event: a stand-in for a drawing"""
+    if key == "drawing_canvas" and event == "strokes":
+        strokes = [{"c": 0, "s": BRUSH_SIZES[0], "p": [100, 100] + [1, 0] * (n - 1)} for n in value["points"]]
+        return {"base": value["base"], "strokes": strokes}
+    return value
+
+
+def _action():
+    """What started this run: a button key, [component, event, value], or None"""
+    for key in COMPONENTS:
+        for event, value in dict(st.session_state.get(key) or {}).items():
+            if value is not None:
+                return [key, event, _anonymize(key, event, value)]
+    for key, value in st.session_state.items():
+        if value is True and BUTTONS.fullmatch(key):
+            return key
+    return None
+
+
+def _session_trace():
+    """This session's trace, or None when it wasn't picked for recording"""
+    if "trace" not in st.session_state:
+        recorded = random.random() < SAMPLE and not st.query_params.get("view")
+        st.session_state.trace = {"id": uuid.uuid4().hex, "started": time.time(), "step": None, "seed": None, "lines": 0} if recorded else None
+    return st.session_state.trace
+
+
+def _write(trace, step):
+    seed = st.session_state.get("round_seed")
+    if seed is not None and seed != trace["seed"]:
+        step["seed"] = trace["seed"] = seed
+    if not trace["lines"]:
+        step["query"] = {name: st.query_params[name] for name in REPLAYED_PARAMS if name in st.query_params}
+    os.makedirs(TRACES_DIR, exist_ok=True)
+    with open(os.path.join(TRACES_DIR, f"trace-{trace['id']}.jsonl"), "a", encoding="utf-8") as f:
+        f.write(json.dumps(step, separators=(",", ":")) + "\n")
+    trace["lines"] += 1
+
+
+def traced(func):
+    """Record the click behind each run of `func`; only the outermost call records
+
+    Use on main() and on every fragment, like `persisted`.
+    """
+    if not SAMPLE:
+        return func
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        trace = _session_trace()
+        if trace is None or getattr(_depth, "value", 0):
+            return func(*args, **kwargs)
+
+        start = time.perf_counter()
+        # A run started by st.rerun() belongs to the click before it
+        if trace["step"] is None:
+            trace["step"] = {"t": round(time.time() - trace["started"], 3), "screen": _screen(), "action": _action(), "ms": 0.0}
+        rerun = False
+        _depth.value = 1
+        try:
+            return func(*args, **kwargs)
+        except BaseException as exc:
+            # st.rerun() ends a run by raising this
+            rerun = type(exc).__name__ == "RerunException"
+            raise
+        finally:
+            _depth.value = 0
+            step = trace["step"]
+            step["ms"] = round(step["ms"] + (time.perf_counter() - start) * 1000, 1)
+            if not rerun:
+                trace["step"] = None
+                _write(trace, step)
+
+    return wrapper
+
+
+def load_trace(path):
+    """A recorded trace as {"seed", "query", "steps": [(screen, action, t, ms)]}"""
+    trace = {"seed": None, "query": {}, "steps": []}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                step = json.loads(line)
+            except ValueError:
+                continue
+            if trace["seed"] is None and "seed" in step:
+                trace["seed"] = step["seed"]
+            if "query" in step:
+                trace["query"] = step["query"]
+            trace["steps"].append((step["screen"], step["action"], step["t"], step["ms"]))
+    return trace
+
+
+def action_label(action):
+    """Name a replayed step reports under: counting_option_2 becomes counting_option_*"""
+    if action is None:
+        return "rerun"
+    if isinstance(action, list):
+        return f"{action[0]}.{action[1]}"
+    return re.sub(r"\d+$", "*", action)